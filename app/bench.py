@@ -0,0 +1,339 @@
+#!/usr/local/bin/python
+
+import gc
+import sys
+import time
+import random
+import asyncio
+import argparse
+import platform
+import itertools
+import functools
+import subprocess
+import typing as t
+
+import ujson
+
+# uid popularity of short links roughly follows Zipf's law
+DEFAULT_ZIPF = 1.1
+DEFAULT_MIX = 'redirect:80,preview:10,shortify:8,delete:2'
+
+SAMPLE_CLIP = {
+    'title': 'Sample article',
+    'content': '<p>' + 'Lorem ipsum dolor sit amet. ' * 400 + '</p>',
+    'textContent': 'Lorem ipsum dolor sit amet. ' * 400,
+}
+
+
+def link_url(uid: str) -> str:
+    return f'https://example.com/{uid}'
+
+
+def percentile(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+
+    ordered = sorted(samples)
+    index = min(int(round(q / 100 * (len(ordered) - 1))), len(ordered) - 1)
+
+    return ordered[index]
+
+
+def zipf_weights(size: int, s: float) -> list[float]:
+    return list(itertools.accumulate(1 / rank ** s for rank in range(1, size + 1)))  # noqa
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    operations = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition(':')
+        operations[name.strip()] = int(weight)
+
+    return operations
+
+
+def summary(
+        samples: list[float],
+        elapsed: float,
+        count: t.Optional[int] = None
+) -> dict[str, float]:
+    count = len(samples) if count is None else count
+
+    return {
+        'count': count,
+        'ops_per_sec': round(count / elapsed, 2) if elapsed else 0.0,
+        'p50_us': round(percentile(samples, 50) * 1e6, 2),
+        'p99_us': round(percentile(samples, 99) * 1e6, 2),
+    }
+
+
+def micro(
+        func: t.Callable[[], t.Any],
+        number: int,
+        repeat: int
+) -> dict[str, float]:
+    samples = []
+    elapsed = 0.0
+
+    # gc pauses are left out to keep runs comparable
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            batch = time.perf_counter() - start
+
+            samples.append(batch / number)
+            elapsed += batch
+    finally:
+        gc.enable()
+
+    return summary(samples, elapsed, number * repeat)
+
+
+def run_micro(number: int, repeat: int) -> dict[str, dict[str, float]]:
+    import main
+
+    from handlers import _ShortifyInput
+    from storage import GzipJsonSerializer, tagged_serializer
+    from utils import parse_ttl
+
+    gzip_serializer = GzipJsonSerializer()
+    serializer = tagged_serializer()
+    gzip_data = gzip_serializer.dumps(SAMPLE_CLIP)
+    data = serializer.dumps(SAMPLE_CLIP)
+
+    loop = asyncio.new_event_loop()
+
+    def render(template, **kwargs):
+        return lambda: loop.run_until_complete(template.render_async(**kwargs))
+
+    benchmarks = {
+        'gzip_json_dumps': lambda: gzip_serializer.dumps(SAMPLE_CLIP),
+        'gzip_json_loads': lambda: gzip_serializer.loads(gzip_data),
+        'tagged_dumps': lambda: serializer.dumps(SAMPLE_CLIP),
+        'tagged_loads': lambda: serializer.loads(data),
+        'parse_ttl': lambda: parse_ttl('12h'),
+        'shortify_input': lambda: _ShortifyInput(
+            {'url': 'https://example.com', 'ttl': '1d', 'clip': 'false'}
+        ),
+        'render_redirect': render(
+            main.redirect_template, url='https://example.com'
+        ),
+        'render_preview': render(
+            main.html_content_template,
+            url='https://example.com',
+            expires='2026-01-01 12:00 UTC',
+            **SAMPLE_CLIP
+        ),
+    }
+
+    try:
+        return {
+            name: micro(func, number, repeat)
+            for name, func in benchmarks.items()
+        }
+    finally:
+        loop.close()
+
+
+async def run_load(
+        storage_type: str,
+        requests: int,
+        concurrency: int,
+        keys: int,
+        zipf: float,
+        mix: dict[str, int],
+        seed: int
+) -> dict[str, t.Any]:
+    import main
+    import jobs
+    import clipper
+    import handlers
+    import settings
+
+    from aiohttp.test_utils import TestClient, TestServer
+    from storage import Fake
+    from utils import (
+        url_storage_key,
+        clip_storage_key,
+        clip_content_key,
+        clip_reference,
+        clip_digest,
+    )
+
+    async def init_fake_storage(app):
+        app['storage'] = Fake()
+        app['storage_listener'] = None
+
+    # clipper service is out of scope, jobs are run against a fake
+    async def init_fake_clipper(app):
+        app['clipper'] = clipper.Fake()
+        app['clip_jobs'] = jobs.ClipJobs(
+            functools.partial(
+                handlers.clipper_task,
+                storage=app['storage'],
+                clipper=app['clipper'],
+            )
+        )
+        app['clip_jobs'].start()
+
+    app = main.init_app()
+    app.on_startup.clear()
+    app.on_startup.append(
+        init_fake_storage if storage_type == 'fake' else main.init_storage
+    )
+    app.on_startup.append(init_fake_clipper)
+
+    rnd = random.Random(seed)
+    uids = [f'bench{i:07d}' for i in range(keys)]
+    urls = [link_url(uid) for uid in uids]
+    weights = zipf_weights(keys, zipf)
+    operations = rnd.choices(
+        list(mix), weights=list(mix.values()), k=requests
+    )
+    headers = {'X-Lnk-Token': settings.TOKEN}
+
+    # deletes take links created during the run, so hot uids stay alive
+    created: list[str] = []
+    samples: dict[str, list[float]] = {name: [] for name in mix}
+    statuses: dict[str, dict[str, int]] = {name: {} for name in mix}
+
+    async def request(client: TestClient, operation: str):
+        uid = rnd.choices(uids, cum_weights=weights)[0]
+
+        start = time.perf_counter()
+        if operation == 'redirect':
+            response = await client.get(f'/{uid}', allow_redirects=False)
+        elif operation == 'preview':
+            response = await client.get(f'/{uid}/preview')
+        elif operation == 'shortify':
+            response = await client.post(
+                '/',
+                data={'url': link_url(uid), 'clip': 'false'},
+                headers=headers
+            )
+        elif operation == 'delete':
+            uid = created.pop() if created else rnd.choice(uids)
+            response = await client.delete(f'/{uid}', headers=headers)
+        else:
+            raise ValueError(f'unknown operation: {operation}')
+
+        body = await response.read()
+        samples[operation].append(time.perf_counter() - start)
+
+        if operation == 'shortify' and response.status == 201:
+            created.append(body.decode())
+
+        status = str(response.status)
+        statuses[operation][status] = statuses[operation].get(status, 0) + 1
+
+    version = clip_digest(SAMPLE_CLIP)
+
+    async with TestClient(TestServer(app)) as client:
+        await app['storage'].multi_set(itertools.chain.from_iterable(
+            (
+                (url_storage_key(uid), url, None),
+                (clip_content_key(url), SAMPLE_CLIP, None),
+                (
+                    clip_storage_key(uid),
+                    clip_reference(clip_content_key(url), version),
+                    None
+                ),
+            )
+            for uid, url in zip(uids, urls)
+        ))
+
+        queue = iter(operations)
+
+        async def worker():
+            for operation in queue:
+                await request(client, operation)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+        await app['storage'].multi_delete(*itertools.chain.from_iterable(
+            (
+                url_storage_key(uid),
+                clip_storage_key(uid),
+                clip_content_key(link_url(uid)),
+            )
+            for uid in itertools.chain(uids, created)
+        ))
+
+    return {
+        'requests': requests,
+        'elapsed_sec': round(elapsed, 3),
+        'rps': round(requests / elapsed, 2),
+        'operations': {
+            name: summary(samples[name], elapsed) | {'statuses': statuses[name]}  # noqa
+            for name in mix
+        },
+    }
+
+
+def revision() -> t.Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='lnk benchmarks')
+    parser.add_argument('suite', choices=('micro', 'load', 'all'))
+    parser.add_argument('--storage', choices=('fake', 'redis'), default='fake')  # noqa
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--keys', type=int, default=10000)
+    parser.add_argument('--zipf', type=float, default=DEFAULT_ZIPF)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--number', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='JSON file, stdout by default')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+
+    result = {
+        'revision': revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'args': vars(args),
+    }
+
+    if args.suite in ('micro', 'all'):
+        result['micro'] = run_micro(args.number, args.repeat)
+
+    if args.suite in ('load', 'all'):
+        import uvloop
+
+        uvloop.install()
+
+        result['load'] = asyncio.run(run_load(
+            args.storage,
+            args.requests,
+            args.concurrency,
+            args.keys,
+            args.zipf,
+            parse_mix(args.mix),
+            args.seed,
+        ))
+
+    output = ujson.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,5 @@
+import time
+import random
 import asyncio
 import logging
 import typing as t
@@ -5,13 +7,86 @@ import typing as t
 import aiohttp
 import ujson
 
+import metrics
 import constants as const
 
 from abc import ABC, abstractmethod
+from enum import Enum
+from collections import OrderedDict
 from urllib.parse import urlparse
 
+from utils import Batcher
+from exceptions import ClipperUnavailable, ClipRejected
+
 log = logging.getLogger(const.LNK)
 
+_REJECTED_STATUSES = frozenset({400, 404, 410, 422})
+
+
+class BreakerState(Enum):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+
+    def __init__(
+            self,
+            threshold: int = 5,
+            reset_timeout: int | float = 30,
+            _timer: t.Callable[[], float] = time.monotonic
+    ):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+
+        self._timer = _timer
+        self._failures = 0
+        self._opened_at: t.Optional[float] = None
+        self._probed_at: t.Optional[float] = None
+
+    @property
+    def state(self) -> BreakerState:
+        if self._opened_at is None:
+            return BreakerState.CLOSED
+
+        if self._timer() - self._opened_at < self.reset_timeout:
+            return BreakerState.OPEN
+
+        return BreakerState.HALF_OPEN
+
+    def allow(self) -> bool:
+        state = self.state
+        if state is BreakerState.CLOSED:
+            return True
+
+        if state is BreakerState.OPEN:
+            return False
+
+        # single probe call decides whether service is back, unless it is lost
+        now = self._timer()
+        if self._probed_at is None or now - self._probed_at >= self.reset_timeout:  # noqa
+            self._probed_at = now
+
+            return True
+
+        return False
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._probed_at = None
+
+    def record_failure(self):
+        self._failures += 1
+        self._probed_at = None
+
+        if self._opened_at is not None or self._failures >= self.threshold:
+            if self._opened_at is None:
+                log.warning('clipper circuit breaker opened')
+
+            self._opened_at = self._timer()
+
 
 class BaseClipper(ABC):
 
@@ -23,18 +98,66 @@ class BaseClipper(ABC):
     async def close(self):
         pass
 
+    @property
+    def state(self) -> BreakerState:
+        return BreakerState.CLOSED
+
 
 class Client(BaseClipper):
 
-    def __init__(self, url: str, token: str, timeout: int = 10):
+    def __init__(
+            self,
+            url: str,
+            token: str,
+            timeout: int = 10,
+            limit: int = 100,
+            limit_per_host: int = 0,
+            dns_ttl: int = 300,
+            keepalive_timeout: int | float = 30,
+            cache_size: int = 1024,
+            cache_ttl: int | float = 60,
+            retries: int = 3,
+            backoff_base: int | float = 0.5,
+            backoff_max: int | float = 10,
+            breaker_threshold: int = 5,
+            breaker_reset_timeout: int | float = 30,
+            batch_size: int = 0,
+            batch_delay: int | float = 0.005,
+            batch_path: str = '',
+            _timer: t.Callable[[], float] = time.monotonic
+    ):
         self.url = urlparse(url)
         self.base_url = self.url.geturl().removesuffix(self.url.path)
         self.token = token
         self.timeout = timeout
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.batch_path = batch_path or f'{self.url.path.rstrip("/")}/batch'
 
         self._timeout = aiohttp.ClientTimeout(total=self.timeout)
-        self._retries = 3
-        self._retries_timeout = 1
+
+        self._timer = _timer
+        self._breaker = CircuitBreaker(
+            breaker_threshold, breaker_reset_timeout, _timer=_timer
+        )
+
+        # urls clipped within a few milliseconds share a single request
+        self._batcher: t.Optional[Batcher] = None
+        if self.batch_size > 1:
+            self._batcher = Batcher(
+                self._clip_batch, self.batch_size, self.batch_delay
+            )
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._cache: OrderedDict[str, tuple[dict[str, str], float]] = OrderedDict()  # noqa
 
         self._session: t.Optional[aiohttp.ClientSession] = None
         if self.base_url and self.token:
@@ -44,38 +167,173 @@ class Client(BaseClipper):
                 timeout=self._timeout,
                 raise_for_status=True,
                 json_serialize=ujson.dumps,
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    use_dns_cache=self.dns_ttl > 0,
+                    ttl_dns_cache=self.dns_ttl or None,
+                    keepalive_timeout=self.keepalive_timeout,
+                ),
             )
 
     async def clip(self, url: str) -> dict[str, str]:
         if self._session is None:
             return {}
 
-        for retry in range(1, self._retries+1):
+        if (clip := self._get_cached(url)) is not None:
+            return clip
+
+        if self._breaker.state is BreakerState.OPEN:
+            metrics.CLIPPER_REJECTED.inc()
+
+            raise ClipperUnavailable('circuit breaker is open')
+
+        # concurrent calls for the same url share a single request
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.create_task(self._clip(url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+
+        # one caller cancelled shouldn't cancel the others
+        return await asyncio.shield(task)
+
+    @property
+    def state(self) -> BreakerState:
+        return self._breaker.state
+
+    @metrics.timed(metrics.CLIPPER_DURATION)
+    async def _clip(self, url: str) -> dict[str, str]:
+        if self._batcher is not None:
+            clip, = await self._batcher.load(url)
+
+            # batch reports urls rejected on their own with null items
+            if not isinstance(clip, dict):
+                raise ClipRejected('url is not clipped')
+        else:
+            clip = await self._request(
+                self.url.path, {'url': url, 'timeout': self.timeout}
+            )
+
+        log.debug('url clipped')
+
+        self._set_cached(url, clip)
+
+        return clip
+
+    async def _clip_batch(self, *urls: str) -> list[t.Any]:
+        clips = await self._request(
+            self.batch_path, {'urls': list(urls), 'timeout': self.timeout}
+        )
+
+        if not isinstance(clips, list) or len(clips) != len(urls):
+            raise ClipperUnavailable('invalid batch response')
+
+        return clips
+
+    async def _request(self, path: str, payload: dict[str, t.Any]) -> t.Any:
+        error = None
+
+        for retry in range(1, self.retries+1):
+            if not self._breaker.allow():
+                metrics.CLIPPER_REJECTED.inc()
+
+                break
+
             try:
-                response = await self._session.post(
-                    self.url.path, json={'url': url, 'timeout': self.timeout}
-                )
-            except Exception as e:
+                response = await self._session.post(path, json=payload)
+                result = await response.json(loads=ujson.loads)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:  # noqa
+                error = e
+
                 log.warning(
                     'error clipping: %s', str(e) or 'empty error message'
                 )
 
-                if retry < self._retries:
-                    await asyncio.sleep(self._retries_timeout)
+                # rejected urls are not worth retrying, service itself is fine
+                if _is_rejected(e):
+                    self._breaker.record_success()
+
+                    raise ClipRejected(str(e))
+
+                self._breaker.record_failure()
+
+                if retry < self.retries:
+                    metrics.CLIPPER_RETRIES.inc()
+
+                    await asyncio.sleep(self._backoff(retry, e))
             else:
-                log.debug('url clipped')
+                self._breaker.record_success()
+
+                return result
+
+        metrics.CLIPPER_FAILURES.inc()
 
-                return await response.json(loads=ujson.loads)
+        raise ClipperUnavailable(str(error) if error else 'circuit breaker is open')  # noqa
 
-        return {}
+    def _backoff(self, retry: int, error: Exception | None = None) -> float:
+        # throttling service tells how long to wait, within the backoff limit
+        if (retry_after := _retry_after(error)) is not None:
+            return min(retry_after, self.backoff_max)
+
+        # full jitter spreads retries of tasks failed at the same moment
+        delay = min(self.backoff_base * 2 ** (retry - 1), self.backoff_max)
+
+        return random.uniform(0, delay)
+
+    def _get_cached(self, url: str) -> t.Optional[dict[str, str]]:
+        try:
+            clip, expires_at = self._cache[url]
+        except KeyError:
+            return None
+
+        if expires_at <= self._timer():
+            del self._cache[url]
+
+            return None
+
+        self._cache.move_to_end(url)
+
+        return clip
+
+    def _set_cached(self, url: str, clip: dict[str, str]):
+        if self.cache_size <= 0 or not clip:
+            return
+
+        self._cache[url] = (clip, self._timer() + self.cache_ttl)
+        self._cache.move_to_end(url)
+
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
 
     async def close(self):
+        # batched clips in flight still need the session
+        if self._batcher is not None:
+            await self._batcher.close()
+
         if self._session is not None:
             await self._session.close()
 
         log.debug('closed')
 
 
+def _is_rejected(error: Exception) -> bool:
+    # only these are about the url itself, other statuses like 408 or 429
+    # are about the service and are retried
+    return isinstance(error, aiohttp.ClientResponseError) and error.status in _REJECTED_STATUSES  # noqa
+
+
+def _retry_after(error: Exception | None) -> float | None:
+    if not isinstance(error, aiohttp.ClientResponseError) or not error.headers:  # noqa
+        return None
+
+    # only delay in seconds is supported, http date is rather unusual here
+    try:
+        return max(int(error.headers.get('Retry-After', '')), 0)
+    except ValueError:
+        return None
+
+
 class Fake(BaseClipper):
 
     async def clip(self, url: str) -> dict[str, str]:
@@ -4,12 +4,22 @@ from enum import Enum
 
 LNK = 'lnk'
 
-KEY_WORDS = {'health', 'static', 'ping', 'lnk'}
+KEY_WORDS = {'health', 'static', 'ping', 'lnk', 'metrics'}
 
 DEFAULT_TTL = '12h'
 INF_TTL = 'inf'
 
 DEFAULT_UID_LEN = 6
+MAX_UID_LEN = 8
+UID_ATTEMPTS_PER_LEN = 3
+
+INVALIDATION_CHANNEL = f'{LNK}-invalidation'
+
+CLIP_READY = 'ready'
+CLIP_MISSING = 'missing'
+
+# seconds between background retries of a failed clip
+CLIP_RETRY_INTERVAL = 60
 
 
 class TimeUnit(Enum):
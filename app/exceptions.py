@@ -4,3 +4,23 @@ class InvalidParameters(Exception):
 
 class StillProcessing(Exception):
     pass
+
+
+class ClipQueueFull(Exception):
+    pass
+
+
+class UIDAlreadyExists(Exception):
+    pass
+
+
+class ProfilingInProgress(Exception):
+    pass
+
+
+class ClipperUnavailable(Exception):
+    pass
+
+
+class ClipRejected(Exception):
+    pass
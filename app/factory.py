@@ -0,0 +1,115 @@
+import typing as t
+
+import redis.asyncio as aioredis
+
+import clipper
+import jobs
+import settings
+
+from storage import (
+    BaseStorage,
+    BaseInvalidationBus,
+    Memory,
+    Sqlite,
+    redis_storage,
+    RedisInvalidationBus,
+    tagged_serializer,
+)
+
+
+def create_storage() -> BaseStorage:
+    serializer = tagged_serializer(
+        settings.SERIALIZER_CODEC, settings.SERIALIZER_ZSTD_DICT
+    )
+
+    if settings.STORAGE == 'memory':
+        return Memory(
+            max_bytes=settings.MEMORY_MAX_BYTES,
+            snapshot_path=settings.MEMORY_SNAPSHOT_PATH or None,
+        )
+
+    if settings.STORAGE == 'sqlite':
+        return Sqlite(
+            settings.SQLITE_PATH,
+            serializer=serializer,
+            mmap_size=settings.SQLITE_MMAP_SIZE,
+        )
+
+    return redis_storage(
+        settings.REDIS_MODE,
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        sentinels=settings.REDIS_SENTINELS,
+        service_name=settings.REDIS_SENTINEL_SERVICE,
+        serializer=serializer,
+        offload_threshold=settings.SERIALIZER_OFFLOAD_THRESHOLD or None,
+        offload_workers=settings.SERIALIZER_OFFLOAD_WORKERS,
+        max_connections=settings.REDIS_MAX_CONNECTIONS or None,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        socket_keepalive=settings.REDIS_SOCKET_KEEPALIVE,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        auto_batch=settings.REDIS_AUTO_BATCH,
+    )
+
+
+def create_invalidation_bus() -> t.Optional[BaseInvalidationBus]:
+    # local storages have no writers on other nodes to hear about
+    if not settings.CACHE_INVALIDATION or settings.STORAGE != 'redis':
+        return None
+
+    return RedisInvalidationBus(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        _client=_redis_client,
+    )
+
+
+def create_redis_clip_jobs() -> jobs.RedisClipJobs:
+    # queue moves jobs between keys of different slots
+    if settings.REDIS_MODE == 'cluster':
+        raise ValueError('redis clip queue is not supported in cluster mode')
+
+    return jobs.RedisClipJobs(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        queue_size=settings.CLIP_QUEUE_SIZE,
+        overflow=jobs.Overflow(settings.CLIP_QUEUE_OVERFLOW),
+        heartbeat_ttl=settings.CLIP_HEARTBEAT_TTL,
+        _client=_redis_client,
+    )
+
+
+def create_clipper() -> clipper.Client:
+    return clipper.Client(
+        url=settings.CLIPPER_URL,
+        token=settings.CLIPPER_TOKEN,
+        limit=settings.CLIPPER_CONNECTIONS,
+        limit_per_host=settings.CLIPPER_CONNECTIONS_PER_HOST,
+        dns_ttl=settings.CLIPPER_DNS_TTL,
+        keepalive_timeout=settings.CLIPPER_KEEPALIVE_TIMEOUT,
+        cache_size=settings.CLIPPER_CACHE_SIZE,
+        cache_ttl=settings.CLIPPER_CACHE_TTL,
+        retries=settings.CLIPPER_RETRIES,
+        backoff_base=settings.CLIPPER_BACKOFF_BASE,
+        backoff_max=settings.CLIPPER_BACKOFF_MAX,
+        breaker_threshold=settings.CLIPPER_BREAKER_THRESHOLD,
+        breaker_reset_timeout=settings.CLIPPER_BREAKER_RESET_TIMEOUT,
+        batch_size=settings.CLIPPER_BATCH_SIZE,
+        batch_delay=settings.CLIPPER_BATCH_DELAY,
+        batch_path=settings.CLIPPER_BATCH_PATH,
+    )
+
+
+def _redis_client(host: str, port: int) -> aioredis.Redis:
+    # sentinel master is looked up, cluster broadcasts published messages,
+    # so any of its nodes serves the bus
+    if settings.REDIS_MODE == 'sentinel':
+        sentinel = aioredis.sentinel.Sentinel(settings.REDIS_SENTINELS)
+
+        return sentinel.master_for(settings.REDIS_SENTINEL_SERVICE)
+
+    if settings.REDIS_MODE not in ('standalone', 'cluster'):
+        raise ValueError(f'unknown redis mode: {settings.REDIS_MODE}')
+
+    return aioredis.Redis(host=host, port=port)
@@ -1,21 +1,33 @@
 import asyncio
+import itertools
+import typing as t
 
 import shortuuid
 
 import constants as const
 import clipper
 
-from storage import BaseStorage
+from storage import BaseStorage, uncached
+from jobs import BaseClipJobs, JobState
 from utils import (
     parse_ttl,
     calc_seconds,
     url_storage_key,
     clip_storage_key,
-    clip_task_name,
+    clip_content_key,
+    clip_retry_key,
+    clip_reference,
+    clip_digest,
+    parse_clip_reference,
     str2bool,
     seconds_to_str_time,
 )
-from exceptions import InvalidParameters, StillProcessing
+from exceptions import (
+    InvalidParameters,
+    StillProcessing,
+    UIDAlreadyExists,
+    ClipRejected,
+)
 
 
 async def healthcheck(storage: BaseStorage) -> bool:
@@ -31,42 +43,215 @@ async def redirect(uid: str, storage: BaseStorage) -> str | None:
 
 async def clip(
         uid: str,
-        storage: BaseStorage
+        storage: BaseStorage,
+        jobs: BaseClipJobs,
+        retry_interval: int = const.CLIP_RETRY_INTERVAL
 ) -> tuple[str | None, dict[str, str] | None, str]:
-    if clip_task_name(uid) in {f.get_name() for f in asyncio.all_tasks()}:
+    url, ref, ttl = await clip_head(uid, storage, jobs)
+    data = await load_clip(uid, url, ref, ttl, storage, jobs, retry_interval)
+
+    return url, data, seconds_to_str_time(ttl)
+
+
+async def clip_head(
+        uid: str,
+        storage: BaseStorage,
+        jobs: BaseClipJobs
+) -> tuple[str | None, t.Any, int]:
+    if await jobs.in_progress(uid):
         raise StillProcessing()
 
-    url, data = await storage.multi_get(url_storage_key(uid), clip_storage_key(uid))  # noqa
-    ttl = await storage.ttl(url_storage_key(uid))
+    (url, ttl), (ref, _) = await storage.multi_get_ttl(
+        url_storage_key(uid), clip_storage_key(uid)
+    )
 
-    return url, data, seconds_to_str_time(ttl)
+    return url, ref, ttl
+
+
+def clip_version(ref: t.Any) -> str | None:
+    if not isinstance(ref, str):
+        return None
+
+    return parse_clip_reference(ref)[1]
+
+
+async def load_clip(
+        uid: str,
+        url: str | None,
+        ref: t.Any,
+        ttl: int,
+        storage: BaseStorage,
+        jobs: BaseClipJobs,
+        retry_interval: int = const.CLIP_RETRY_INTERVAL
+) -> dict[str, str] | None:
+    # clips are stored once per url, uid keeps a reference to it
+    data, lost = ref, False
+    if isinstance(ref, str):
+        data = await storage.get(parse_clip_reference(ref)[0])
+        lost = data is None
+
+    # failed or lost clip is retried in background, at most once per
+    # interval, so clipper outage isn't hit by every view
+    if url is not None and data is None:
+        if lost or await jobs.state(uid) is JobState.FAILED:
+            if await storage.set(clip_retry_key(uid), 1, ttl=retry_interval, nx=True):  # noqa
+                await jobs.submit(uid, url, ttl if ttl >= 0 else None)
+
+    return data
+
+
+async def multi_resolve(
+        uids: list[str],
+        storage: BaseStorage,
+        jobs: BaseClipJobs
+) -> list[dict[str, t.Any]]:
+    if not uids:
+        return []
+
+    url_keys = [url_storage_key(uid) for uid in uids]
+    clip_keys = [clip_storage_key(uid) for uid in uids]
+
+    storage = uncached(storage)
+
+    items, states = await asyncio.gather(
+        storage.multi_get_ttl(*url_keys, *clip_keys),
+        jobs.multi_state(*uids),
+    )
+    urls = [url for url, _ in items[:len(uids)]]
+    ttls = [ttl for _, ttl in items[:len(uids)]]
+    clips = [clip for clip, _ in items[len(uids):]]
+
+    # referenced clip could be gone, while the reference is still there
+    refs = [
+        parse_clip_reference(c)[0] if isinstance(c, str) else c for c in clips
+    ]
+    content_keys = list({r for r in refs if isinstance(r, str)})
+    stored = set()
+    if content_keys:
+        content_ttls = await storage.multi_ttl(*content_keys)
+        stored = {
+            k for k, k_ttl in zip(content_keys, content_ttls) if k_ttl != -2
+        }
+
+    results = []
+    for uid, url, ttl, clip, state in zip(uids, urls, ttls, refs, states):
+        if state in (JobState.PENDING, JobState.RUNNING):
+            clip_status = state.value
+        elif clip is not None and (not isinstance(clip, str) or clip in stored):  # noqa
+            clip_status = const.CLIP_READY
+        elif state is JobState.FAILED:
+            clip_status = state.value
+        else:
+            clip_status = const.CLIP_MISSING
+
+        results.append({
+            'uid': uid,
+            'url': url,
+            'ttl': ttl if url is not None and ttl >= 0 else None,
+            'clip': clip_status if url is not None else None,
+        })
+
+    return results
 
 
 async def shortify(
         data: dict,
         storage: BaseStorage,
-        clipper: clipper.BaseClipper
+        jobs: BaseClipJobs
 ) -> str:
     input_args = _ShortifyInput(data)
 
-    await storage.set(
-        url_storage_key(input_args.uid), input_args.url, ttl=input_args.ttl
-    )
+    if input_args.clip:
+        await jobs.ensure_capacity()
+
+    for uid in input_args.uids():
+        key = url_storage_key(uid)
+        if await storage.set(key, input_args.url, ttl=input_args.ttl, nx=True):  # noqa
+            input_args.uid = uid
+
+            break
+    else:
+        raise UIDAlreadyExists()
 
     if input_args.clip:
-        asyncio.Task(
-            _clipper_task(
-                input_args.uid, input_args.url, input_args.ttl, storage, clipper  # noqa
-            ),
-            name=clip_task_name(input_args.uid)
-        )
+        await jobs.submit(input_args.uid, input_args.url, input_args.ttl)
 
     return input_args.uid
 
 
+async def multi_shortify(
+        entries: list,
+        storage: BaseStorage,
+        jobs: BaseClipJobs
+) -> list[dict[str, str]]:
+    storage = uncached(storage)
+
+    results: list[dict[str, str]] = []
+    attempts = []
+
+    for entry in entries:
+        if not isinstance(entry, dict):
+            results.append({'error': 'Invalid input: object expected'})
+
+            continue
+
+        try:
+            input_args = _ShortifyInput(entry)
+        except InvalidParameters as e:
+            results.append({'error': f'Invalid input parameter: {e}'})
+
+            continue
+
+        attempts.append((len(results), input_args, input_args.uids()))
+        results.append({})
+
+    if any(input_args.clip for _, input_args, _ in attempts):
+        await jobs.ensure_capacity()
+
+    created = []
+    while attempts:
+        batch = []
+        for index, input_args, uids in attempts:
+            if (uid := next(uids, None)) is None:
+                results[index] = {'error': 'UID already exists'}
+            else:
+                batch.append((index, input_args, uids, uid))
+
+        if not batch:
+            break
+
+        written = await storage.multi_set(
+            ((url_storage_key(uid), i.url, i.ttl) for _, i, _, uid in batch),
+            nx=True
+        )
+
+        attempts = []
+        for (index, input_args, uids, uid), ok in zip(batch, written):
+            if ok:
+                input_args.uid = uid
+                results[index] = {'uid': uid}
+                created.append(input_args)
+            else:
+                attempts.append((index, input_args, uids))
+
+    clip_inputs = [i for i in created if i.clip]
+    if clip_inputs:
+        await jobs.multi_submit((i.uid, i.url, i.ttl) for i in clip_inputs)
+
+    return results
+
+
+def _random_uids() -> t.Iterator[str]:
+    for length in range(const.DEFAULT_UID_LEN, const.MAX_UID_LEN + 1):
+        for _ in range(const.UID_ATTEMPTS_PER_LEN):
+            uid = shortuuid.random(length=length)
+            if uid not in const.KEY_WORDS:
+                yield uid
+
+
 class _ShortifyInput:
 
-    __slots__ = ('_data', 'url', 'ttl', 'ttl_str', 'clip', 'uid')
+    __slots__ = ('_data', 'url', 'ttl', 'ttl_str', 'clip', 'uid', 'custom_uid')  # noqa
 
     def __init__(self, data: dict[str, str]):
         self._data = data
@@ -74,6 +259,8 @@ class _ShortifyInput:
         self.url = self._data.get('url', '')
         if not self.url:
             raise InvalidParameters('url not provided')
+        if not isinstance(self.url, str):
+            raise InvalidParameters('invalid url value')
 
         self.ttl: int | None = None
         self.ttl_str = self._data.get('ttl', const.DEFAULT_TTL)
@@ -90,23 +277,53 @@ class _ShortifyInput:
         except Exception:
             raise InvalidParameters('invalid clip value')
 
-        self.uid = self._data.get('uid', shortuuid.random(length=const.DEFAULT_UID_LEN))  # noqa
+        self.custom_uid = 'uid' in self._data
+        self.uid = self._data['uid'] if self.custom_uid else next(_random_uids())  # noqa
+        if not isinstance(self.uid, str) or not self.uid:
+            raise InvalidParameters('invalid uid value')
         if self.uid in const.KEY_WORDS:
             raise InvalidParameters(f'"{self.uid}" couldn\'t be uid')
 
+    def uids(self) -> t.Iterator[str]:
+        yield self.uid
+
+        # generated uid collided, retry with new ones growing in length
+        if not self.custom_uid:
+            yield from itertools.islice(_random_uids(), 1, None)
 
-async def _clipper_task(
+
+async def clipper_task(
         uid: str,
         url: str,
         ttl: int | None,
         storage: BaseStorage,
         clipper: clipper.BaseClipper
 ):
-    clip = await clipper.clip(url)
-    await storage.set(clip_storage_key(uid), clip, ttl=ttl)
+    try:
+        clip = await clipper.clip(url)
+    except ClipRejected:
+        # url couldn't be clipped at all, so empty clip is final
+        clip = {}
+
+    content_key = clip_content_key(url)
+    clip_key = clip_storage_key(uid)
+
+    # shared clip lives as long as its longest lived reference, reference
+    # carries clip version, so pages rendered from it are cached by version
+    await storage.set_shared(content_key, clip, clip_key, ttl=ttl)
+    await storage.set(
+        clip_key, clip_reference(content_key, clip_digest(clip)), ttl=ttl
+    )
 
 
 async def delete(uid: str, storage: BaseStorage) -> bool:
-    deleted = await storage.multi_delete(url_storage_key(uid), clip_storage_key(uid))  # noqa
+    url_key, clip_key = url_storage_key(uid), clip_storage_key(uid)
+
+    ref = await storage.get(clip_key)
+    deleted = await storage.multi_delete(url_key, clip_key)
+
+    # shared clip is removed with the last reference to it
+    if isinstance(ref, str):
+        await storage.release_shared(parse_clip_reference(ref)[0], clip_key)
 
     return bool(deleted)
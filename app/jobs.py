@@ -0,0 +1,454 @@
+import asyncio
+import logging
+import typing as t
+
+import ujson
+import redis.asyncio as aioredis
+
+import constants as const
+
+from abc import ABC, abstractmethod
+from enum import Enum
+from collections import OrderedDict
+
+from utils import clip_task_name, clip_job_key
+from exceptions import ClipQueueFull
+
+log = logging.getLogger(const.LNK)
+
+JobType = t.Callable[
+    [str, str, t.Optional[int]], t.Coroutine[t.Any, t.Any, t.Any]
+]
+JobItemType = tuple[str, str, t.Optional[int]]
+
+
+class JobState(Enum):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+
+
+class Overflow(Enum):
+    REJECT = 'reject'
+    SHED = 'shed'
+    SKIP = 'skip'
+
+
+class BaseClipJobs(ABC):
+
+    @abstractmethod
+    async def ensure_capacity(self):
+        pass
+
+    @abstractmethod
+    async def submit(self, uid: str, url: str, ttl: t.Optional[int]) -> bool:
+        pass
+
+    @abstractmethod
+    async def multi_submit(self, items: t.Iterable[JobItemType]) -> list[bool]:
+        pass
+
+    @abstractmethod
+    async def state(self, uid: str) -> JobState | None:
+        pass
+
+    @abstractmethod
+    async def multi_state(self, *uids: str) -> list[JobState | None]:
+        pass
+
+    @abstractmethod
+    async def in_progress(self, uid: str) -> bool:
+        pass
+
+    @abstractmethod
+    async def stats(self) -> dict[str, int]:
+        pass
+
+    @abstractmethod
+    async def close(self, timeout: t.Optional[int | float] = None):
+        pass
+
+
+class _Job:
+
+    __slots__ = ('uid', 'url', 'ttl', 'state')
+
+    def __init__(self, uid: str, url: str, ttl: t.Optional[int]):
+        self.uid = uid
+        self.url = url
+        self.ttl = ttl
+        self.state = JobState.PENDING
+
+
+class ClipJobs(BaseClipJobs):
+
+    def __init__(
+            self,
+            run: JobType,
+            workers: int = 8,
+            queue_size: int = 1024,
+            overflow: Overflow = Overflow.SKIP,
+            failed_size: int = 1024
+    ):
+        self.run = run
+        self.workers = workers
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.failed_size = failed_size
+
+        self._queue: asyncio.Queue[_Job] = asyncio.Queue(maxsize=queue_size)
+        self._active: dict[str, _Job] = {}
+        self._failed: OrderedDict[str, None] = OrderedDict()
+        self._workers: list[asyncio.Task] = []
+        self._running = 0
+        self._closed = False
+
+    def start(self):
+        self._workers = [
+            asyncio.create_task(self._work(), name=f'clip_worker_{i}')
+            for i in range(self.workers)
+        ]
+
+    async def ensure_capacity(self):
+        if self.overflow is Overflow.REJECT and self._queue.full():
+            raise ClipQueueFull()
+
+    async def submit(self, uid: str, url: str, ttl: t.Optional[int]) -> bool:
+        if self._closed:
+            log.warning('clip jobs closed, job skipped')
+
+            return False
+
+        if self._queue.full():
+            if self.overflow is not Overflow.SHED:
+                log.warning('clip queue is full, job skipped')
+
+                return False
+
+            shed = self._queue.get_nowait()
+            self._queue.task_done()
+            self._forget(shed)
+
+            log.warning('clip queue is full, oldest job shed')
+
+        job = _Job(uid, url, ttl)
+
+        self._failed.pop(uid, None)
+        self._active[uid] = job
+        self._queue.put_nowait(job)
+
+        return True
+
+    async def multi_submit(self, items: t.Iterable[JobItemType]) -> list[bool]:
+        return [await self.submit(*item) for item in items]
+
+    async def state(self, uid: str) -> JobState | None:
+        if job := self._active.get(uid):
+            return job.state
+
+        return JobState.FAILED if uid in self._failed else None
+
+    async def multi_state(self, *uids: str) -> list[JobState | None]:
+        return [await self.state(uid) for uid in uids]
+
+    async def in_progress(self, uid: str) -> bool:
+        return uid in self._active
+
+    @property
+    def depth(self) -> int:
+        return len(self._active)
+
+    async def stats(self) -> dict[str, int]:
+        return {
+            'depth': self.depth,
+            'pending': self.depth - self._running,
+            'running': self._running,
+            'failed': len(self._failed),
+        }
+
+    async def close(self, timeout: t.Optional[int | float] = None):
+        self._closed = True
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            log.warning('clip jobs not drained, %d dropped', self.depth)
+
+        for worker in self._workers:
+            worker.cancel()
+
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+        log.debug('clip jobs closed')
+
+    async def _work(self):
+        worker = asyncio.current_task()
+        worker_name = worker.get_name()
+
+        while True:
+            job = await self._queue.get()
+
+            # job could be superseded by resubmitting the same uid
+            if self._active.get(job.uid) is not job:
+                self._queue.task_done()
+
+                continue
+
+            job.state = JobState.RUNNING
+            self._running += 1
+            worker.set_name(clip_task_name(job.uid))
+
+            try:
+                await self.run(job.uid, job.url, job.ttl)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(
+                    'clip job failed: %s', str(e) or 'empty error message'
+                )
+
+                job.state = JobState.FAILED
+            finally:
+                self._running -= 1
+                worker.set_name(worker_name)
+                self._forget(job)
+                self._queue.task_done()
+
+    def _forget(self, job: _Job):
+        if self._active.get(job.uid) is not job:
+            return
+
+        del self._active[job.uid]
+
+        if job.state is JobState.FAILED:
+            self._failed[job.uid] = None
+
+            while len(self._failed) > self.failed_size:
+                self._failed.popitem(last=False)
+
+
+class RedisClipJobs(BaseClipJobs):
+
+    QUEUE_KEY = f'{const.LNK}-clip-queue'
+    PROCESSING_KEY = f'{const.LNK}-clip-processing'
+    HEARTBEAT_KEY = f'{const.LNK}-clip-heartbeat'
+
+    def __init__(
+            self,
+            host: str,
+            port: t.Optional[int] = None,
+            queue_size: int = 1024,
+            overflow: Overflow = Overflow.SKIP,
+            state_ttl: int = 24 * 60 * 60,
+            heartbeat_ttl: int = 30,
+            _client: t.Callable = aioredis.Redis
+    ):
+        self.host = host
+        self.port = port or 6379
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.state_ttl = state_ttl
+        self.heartbeat_ttl = heartbeat_ttl
+
+        self._client = _client(host=self.host, port=self.port)
+
+    async def ensure_capacity(self):
+        if self.overflow is not Overflow.REJECT:
+            return
+
+        if await self._client.llen(self.QUEUE_KEY) >= self.queue_size:
+            raise ClipQueueFull()
+
+    async def submit(self, uid: str, url: str, ttl: t.Optional[int]) -> bool:
+        return (await self.multi_submit([(uid, url, ttl)]))[0]
+
+    async def multi_submit(self, items: t.Iterable[JobItemType]) -> list[bool]:
+        items = list(items)
+        free = max(self.queue_size - await self._client.llen(self.QUEUE_KEY), 0)  # noqa
+
+        accepted, shed = items, 0
+        if len(items) > free:
+            if self.overflow is Overflow.SHED:
+                shed = len(items) - free
+            else:
+                accepted = items[:free]
+
+                log.warning(
+                    'clip queue is full, %d jobs skipped', len(items) - free
+                )
+
+        if not accepted:
+            return [False] * len(items)
+
+        async with self._client.pipeline(transaction=False) as pipe:
+            for uid, url, ttl in accepted:
+                payload = ujson.dumps({'uid': uid, 'url': url, 'ttl': ttl})
+
+                pipe.set(clip_job_key(uid), JobState.PENDING.value, ex=self.state_ttl)  # noqa
+                pipe.lpush(self.QUEUE_KEY, payload)
+
+            for _ in range(shed):
+                pipe.rpop(self.QUEUE_KEY)
+
+            results = await pipe.execute()
+
+        if shed:
+            shed_keys = [
+                clip_job_key(ujson.loads(payload)['uid'])
+                for payload in results[-shed:] if payload is not None
+            ]
+            if shed_keys:
+                await self._client.delete(*shed_keys)
+
+            log.warning('clip queue is full, %d oldest jobs shed', shed)
+
+        return [True] * len(accepted) + [False] * (len(items) - len(accepted))
+
+    async def state(self, uid: str) -> JobState | None:
+        state = await self._client.get(clip_job_key(uid))
+
+        return None if state is None else JobState(state.decode())
+
+    async def multi_state(self, *uids: str) -> list[JobState | None]:
+        if not uids:
+            return []
+
+        states = await self._client.mget(*(clip_job_key(uid) for uid in uids))
+
+        return [None if s is None else JobState(s.decode()) for s in states]
+
+    async def in_progress(self, uid: str) -> bool:
+        return await self.state(uid) in (JobState.PENDING, JobState.RUNNING)
+
+    async def stats(self) -> dict[str, int]:
+        return {'depth': await self._client.llen(self.QUEUE_KEY)}
+
+    async def consume(
+            self,
+            run: JobType,
+            consumer_id: str,
+            timeout: int = 1,
+            retry_timeout: int | float = 1
+    ):
+        processing_key = f'{self.PROCESSING_KEY}:{consumer_id}'
+        heartbeat = None
+
+        try:
+            while True:
+                try:
+                    # consumer is alive while its heartbeat is, so others
+                    # won't reap it
+                    await self._beat(consumer_id)
+                    if heartbeat is None:
+                        heartbeat = asyncio.create_task(
+                            self._heartbeat(consumer_id)
+                        )
+
+                    await self._consume(run, processing_key, timeout)
+                except aioredis.RedisError as e:
+                    log.warning(
+                        'clip queue error: %s', str(e) or 'empty error message'  # noqa
+                    )
+
+                await asyncio.sleep(retry_timeout)
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+
+    async def reap(self) -> int:
+        prefix = f'{self.PROCESSING_KEY}:'
+        reaped = 0
+
+        async for key in self._client.scan_iter(match=f'{prefix}*'):
+            key = key.decode() if isinstance(key, bytes) else key
+
+            if await self._client.exists(self._heartbeat_key(key.removeprefix(prefix))):  # noqa
+                continue
+
+            reaped += await self._requeue(key)
+
+        if reaped:
+            log.warning('%d clip jobs of dead consumers requeued', reaped)
+
+        return reaped
+
+    async def _consume(self, run: JobType, processing_key: str, timeout: int):
+        # jobs left by a previous run of the same consumer, or unacked ones
+        # of this run when redis failed
+        if requeued := await self._requeue(processing_key):
+            log.info('%d clip jobs requeued', requeued)
+
+        while True:
+            payload = await self._client.brpoplpush(
+                self.QUEUE_KEY, processing_key, timeout
+            )
+            if payload is None:
+                continue
+
+            job = ujson.loads(payload)
+            job_key = clip_job_key(job['uid'])
+
+            await self._client.set(job_key, JobState.RUNNING.value, ex=self.state_ttl)  # noqa
+
+            failed = False
+            try:
+                await run(job['uid'], job['url'], job['ttl'])
+            except Exception as e:
+                log.warning(
+                    'clip job failed: %s', str(e) or 'empty error message'
+                )
+
+                failed = True
+
+            async with self._client.pipeline() as pipe:
+                if failed:
+                    pipe.set(job_key, JobState.FAILED.value, ex=self.state_ttl)  # noqa
+                else:
+                    pipe.delete(job_key)
+                pipe.lrem(processing_key, 1, payload)
+
+                await pipe.execute()
+
+    async def _requeue(self, processing_key: str) -> int:
+        requeued = 0
+
+        while payload := await self._client.rpoplpush(processing_key, self.QUEUE_KEY):  # noqa
+            job = ujson.loads(payload)
+            await self._client.set(clip_job_key(job['uid']), JobState.PENDING.value, ex=self.state_ttl)  # noqa
+
+            requeued += 1
+
+        return requeued
+
+    async def _heartbeat(self, consumer_id: str):
+        while True:
+            await asyncio.sleep(self.heartbeat_ttl / 3)
+
+            try:
+                await self._beat(consumer_id)
+                await self.reap()
+            except Exception as e:
+                log.warning(
+                    'clip consumer heartbeat error: %s',
+                    str(e) or 'empty error message'
+                )
+
+    async def _beat(self, consumer_id: str):
+        await self._client.set(
+            self._heartbeat_key(consumer_id), 1, ex=self.heartbeat_ttl
+        )
+
+    def _heartbeat_key(self, consumer_id: str) -> str:
+        return f'{self.HEARTBEAT_KEY}:{consumer_id}'
+
+    async def close(self, timeout: t.Optional[int | float] = None):
+        if self._client is None:
+            return
+
+        # sentinel master client doesn't own its pool
+        await self._client.close()
+        await self._client.connection_pool.disconnect()
+
+        self._client = None
+
+        log.debug('clip jobs closed')
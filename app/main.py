@@ -1,21 +1,35 @@
 #!/usr/local/bin/python
 
+import time
 import logging
 import asyncio
+import functools
 
+import ujson
 import uvloop
 import jinja2 as j2
 
 import handlers
-import clipper
+import factory
+import jobs
+import metrics
+import pages
+import profiler
 import constants as const
 import settings
 
 from aiohttp import web
 
-from storage import Redis, GzipJsonSerializer
-from middlewares import compression_middleware
-from exceptions import InvalidParameters, StillProcessing
+from storage import Cached
+from utils import seconds_to_expiry
+from middlewares import compression_middleware, metrics_middleware
+from exceptions import (
+    InvalidParameters,
+    StillProcessing,
+    ClipQueueFull,
+    UIDAlreadyExists,
+    ProfilingInProgress,
+)
 
 log = logging.getLogger(const.LNK)
 
@@ -48,16 +62,43 @@ async def health(request: web.Request) -> web.Response:
     storage = request.app['storage']
 
     healthy = await handlers.healthcheck(storage)
-    if healthy:
-        return web.Response(
-            headers={'Cache-Control': 'no-store'},
-            text='healthy',
-        )
 
+    # clipper outage only degrades clips, so it doesn't fail the check
+    return web.json_response(
+        {
+            'status': 'healthy' if healthy else 'unhealthy',
+            'clipper': request.app['clipper'].state.value,
+        },
+        headers={'Cache-Control': 'no-store'},
+        status=200 if healthy else 500,
+        dumps=ujson.dumps,
+    )
+
+
+@routes.get('/metrics')
+async def metrics_view(_: web.Request) -> web.Response:
     return web.Response(
+        headers={
+            'Cache-Control': 'no-store',
+            'Content-Type': 'text/plain; version=0.0.4; charset=utf-8',
+        },
+        text=metrics.REGISTRY.render(),
+    )
+
+
+@routes.get('/lnk/stats')
+async def stats(request: web.Request) -> web.Response:
+    if request.headers.get('X-Lnk-Token') != settings.TOKEN:
+        return web.Response(status=403)
+
+    return web.json_response(
+        {
+            'storage': request.app['storage'].stats,
+            'clip_jobs': await request.app['clip_jobs'].stats(),
+            'preview_cache': request.app['preview_cache'].stats,
+        },
         headers={'Cache-Control': 'no-store'},
-        status=500,
-        text='unhealthy',
+        dumps=ujson.dumps,
     )
 
 
@@ -85,51 +126,103 @@ async def redirect(request: web.Request) -> web.Response:
 
 
 @routes.get('/{uid}/text')
-async def text_content(request: web.Request) -> web.Response:
+async def text_content(request: web.Request) -> web.StreamResponse:
     uid = request.match_info['uid']
     storage = request.app['storage']
+    clip_jobs = request.app['clip_jobs']
 
     try:
-        url, data, _ = await handlers.clip(uid, storage)
+        url, data, _ = await handlers.clip(
+            uid, storage, clip_jobs, settings.CLIP_RETRY_INTERVAL
+        )
     except StillProcessing:
         return web.Response(status=202, text='Clip in process')
 
     if url is None:
         return web.Response(status=404, text='Clip not found')
 
+    text = data.get('textContent', '') if data else ''
+    headers = {'Cache-Control': 'private, max-age=60'}
+
+    if pages.is_large(data, settings.STREAM_THRESHOLD):
+        return await pages.stream_page(
+            request, headers, (text,), settings.STREAM_CHUNK_SIZE
+        )
+
     return web.Response(
         status=200,
-        headers={'Cache-Control': 'private, max-age=60'},
+        headers=headers,
         content_type='text/html',
         charset='utf-8',
-        body=data['textContent'] if data else ''
+        body=text
     )
 
 
 @routes.get('/{uid}/preview')
-async def html_content(request: web.Request) -> web.Response:
+async def html_content(request: web.Request) -> web.StreamResponse:
     uid = request.match_info['uid']
     storage = request.app['storage']
+    clip_jobs = request.app['clip_jobs']
 
     try:
-        url, data, ttl = await handlers.clip(uid, storage)
+        url, ref, ttl = await handlers.clip_head(uid, storage, clip_jobs)
     except StillProcessing:
         return web.Response(status=202, text='Clip in process')
 
     if url is None:
         return web.Response(status=404, text='Clip not found')
 
-    if data:
-        html = await html_content_template.render_async(url=url, ttl=ttl, **data)  # noqa
-    else:
-        html = await empty_content_template.render_async(url=url, ttl=ttl)
+    preview_cache = request.app['preview_cache']
+
+    # page is cached by clip version, so cached page is served without
+    # loading the clip, expiry moment changes only with the link itself
+    expires = seconds_to_expiry(ttl, time.time())
+    version = handlers.clip_version(ref)
+    variant = (url, version, expires)
+
+    page = preview_cache.get(uid, variant) if version else None
+    if page is None:
+        data = await handlers.load_clip(
+            uid, url, ref, ttl, storage, clip_jobs,
+            settings.CLIP_RETRY_INTERVAL
+        )
 
+        # huge articles are not worth caching, rendered page is streamed
+        if data and pages.is_large(data, settings.STREAM_THRESHOLD):
+            return await pages.stream_page(
+                request,
+                {'Cache-Control': 'private, max-age=60'},
+                html_content_template.generate_async(
+                    url=url, expires=expires, **data
+                ),
+                settings.STREAM_CHUNK_SIZE,
+            )
+
+        if data:
+            html = await html_content_template.render_async(url=url, expires=expires, **data)  # noqa
+        else:
+            html = await empty_content_template.render_async(url=url, expires=expires)  # noqa
+
+        page = pages.RenderedPage(html.encode())
+        if version:
+            preview_cache.set(uid, variant, page)
+
+    headers = {
+        'Cache-Control': 'private, max-age=60',
+        'ETag': page.etag,
+        'Vary': 'Accept-Encoding',
+    }
+
+    if pages.etag_matches(request.headers.get('If-None-Match', ''), page.etag):  # noqa
+        return web.Response(status=304, headers=headers)
+
+    # compressed once by compression middleware cache
     return web.Response(
         status=200,
-        headers={'Cache-Control': 'private, max-age=60'},
+        headers=headers,
         content_type='text/html',
         charset='utf-8',
-        body=html
+        body=page.body
     )
 
 
@@ -143,18 +236,89 @@ async def shortify(request: web.Request) -> web.Response:
 
     form = await request.post()
     storage = request.app['storage']
-    clipper = request.app['clipper']
+    clip_jobs = request.app['clip_jobs']
 
     try:
-        uid = await handlers.shortify(form, storage, clipper)
+        uid = await handlers.shortify(form, storage, clip_jobs)
     except InvalidParameters as e:
         return web.Response(status=400, text=f'Invalid input parameter: {e}')
-    except ValueError:
+    except UIDAlreadyExists:
         return web.Response(status=409, text='UID already exists')
+    except ClipQueueFull:
+        return web.Response(status=503, text='Clip queue is full')
 
     return web.Response(status=201, text=uid)
 
 
+@routes.post('/lnk/bulk')
+async def bulk_shortify(request: web.Request) -> web.Response:
+    if request.headers.get('X-Lnk-Token') != settings.TOKEN:
+        return web.Response(status=403)
+
+    if not request.can_read_body:
+        return web.Response(status=400, text='Empty body')
+
+    try:
+        if request.content_type == 'application/x-ndjson':
+            entries = [
+                ujson.loads(line)
+                for line in (await request.text()).splitlines() if line.strip()
+            ]
+        else:
+            entries = await request.json(loads=ujson.loads)
+    except ValueError:
+        return web.Response(status=400, text='Invalid JSON')
+
+    if not isinstance(entries, list):
+        return web.Response(status=400, text='List of entries expected')
+
+    if len(entries) > settings.BULK_MAX_SIZE:
+        return web.Response(
+            status=413, text=f'Too many entries, max {settings.BULK_MAX_SIZE}'
+        )
+
+    storage = request.app['storage']
+    clip_jobs = request.app['clip_jobs']
+
+    try:
+        results = await handlers.multi_shortify(entries, storage, clip_jobs)
+    except ClipQueueFull:
+        return web.Response(status=503, text='Clip queue is full')
+
+    return web.json_response(results, dumps=ujson.dumps)
+
+
+@routes.post('/lnk/resolve')
+async def bulk_resolve(request: web.Request) -> web.Response:
+    if request.headers.get('X-Lnk-Token') != settings.TOKEN:
+        return web.Response(status=403)
+
+    if not request.can_read_body:
+        return web.Response(status=400, text='Empty body')
+
+    try:
+        uids = await request.json(loads=ujson.loads)
+    except ValueError:
+        return web.Response(status=400, text='Invalid JSON')
+
+    if not isinstance(uids, list) or not all(isinstance(u, str) for u in uids):  # noqa
+        return web.Response(status=400, text='List of uids expected')
+
+    if len(uids) > settings.BULK_MAX_SIZE:
+        return web.Response(
+            status=413, text=f'Too many uids, max {settings.BULK_MAX_SIZE}'
+        )
+
+    storage = request.app['storage']
+    clip_jobs = request.app['clip_jobs']
+
+    results = await handlers.multi_resolve(uids, storage, clip_jobs)
+
+    return web.json_response(
+        results, headers={'Cache-Control': 'no-store'}, dumps=ujson.dumps
+    )
+
+
 @routes.delete('/{uid}')
 async def delete(request: web.Request) -> web.Response:
     if request.headers.get('X-Lnk-Token') != settings.TOKEN:
@@ -164,6 +328,7 @@ async def delete(request: web.Request) -> web.Response:
     storage = request.app['storage']
 
     deleted = await handlers.delete(uid, storage)
+    request.app['preview_cache'].invalidate(uid)
 
     if deleted:
         return web.Response(status=200, text=f'UID {uid} removed')
@@ -171,48 +336,130 @@ async def delete(request: web.Request) -> web.Response:
     return web.Response(status=404, text=f'UID {uid} not found')
 
 
-async def init_storage(app: web.Application):
-    storage = Redis(
-        host=settings.REDIS_HOST,
-        port=settings.REDIS_PORT if settings.REDIS_PORT is None else int(settings.REDIS_PORT),  # noqa
-        serializer=GzipJsonSerializer()
+async def profile(request: web.Request) -> web.Response:
+    if request.headers.get('X-Lnk-Token') != settings.TOKEN:
+        return web.Response(status=403)
+
+    try:
+        seconds = float(request.query.get('seconds', '10'))
+    except ValueError:
+        return web.Response(status=400, text='Invalid seconds value')
+
+    try:
+        stacks = await request.app['sampling_profiler'].profile(seconds)
+    except ProfilingInProgress:
+        return web.Response(status=409, text='Profiling in progress')
+
+    return web.Response(
+        headers={'Cache-Control': 'no-store'},
+        text=stacks,
     )
+
+
+async def init_storage(app: web.Application):
+    storage = factory.create_storage()
     if not await storage.ping():
         raise ConnectionError('cannot ping storage')
 
+    app['storage_listener'] = None
+
+    # local storages are about as fast as the cache, and sqlite file shared
+    # by processes has no bus to invalidate their caches
+    if settings.CACHE_SIZE > 0 and settings.STORAGE == 'redis':
+        bus = factory.create_invalidation_bus()
+        storage = Cached(
+            storage,
+            size=settings.CACHE_SIZE,
+            max_ttl=settings.CACHE_TTL,
+            negative_ttl=settings.CACHE_NEGATIVE_TTL,
+            bus=bus
+        )
+
+        if bus is not None:
+            app['storage_listener'] = asyncio.create_task(storage.listen())
+
     app['storage'] = storage
 
     log.debug('storage initialized')
 
 
 async def init_clipper(app: web.Application):
-    app['clipper'] = clipper.Client(
-        url=settings.CLIPPER_URL,
-        token=settings.CLIPPER_TOKEN
-    )
+    app['clipper'] = factory.create_clipper()
+
+    if settings.CLIP_QUEUE == 'redis':
+        app['clip_jobs'] = factory.create_redis_clip_jobs()
+    else:
+        app['clip_jobs'] = jobs.ClipJobs(
+            functools.partial(
+                handlers.clipper_task,
+                storage=app['storage'],
+                clipper=app['clipper'],
+            ),
+            workers=settings.CLIP_WORKERS,
+            queue_size=settings.CLIP_QUEUE_SIZE,
+            overflow=jobs.Overflow(settings.CLIP_QUEUE_OVERFLOW),
+        )
+        app['clip_jobs'].start()
 
     log.debug('clipper initialized')
 
 
+async def init_profiler(app: web.Application):
+    app['loop_monitor'] = profiler.LoopMonitor(
+        interval=settings.PROFILER_LAG_INTERVAL,
+        slow_threshold=settings.PROFILER_SLOW_THRESHOLD,
+    )
+    app['loop_monitor'].start()
+
+    app['sampling_profiler'] = profiler.SamplingProfiler(
+        interval=settings.PROFILER_SAMPLE_INTERVAL,
+        max_seconds=settings.PROFILER_MAX_SECONDS,
+    )
+
+    log.debug('profiler initialized')
+
+
+async def close_profiler(app: web.Application):
+    await app['loop_monitor'].close()
+
+
 async def close_storage(app: web.Application):
+    if listener := app['storage_listener']:
+        listener.cancel()
+
     await app['storage'].close()
 
 
 async def close_clipper(app: web.Application):
+    await app['clip_jobs'].close(timeout=settings.CLIP_DRAIN_TIMEOUT)
+
     if clipper := app['clipper']:
         await clipper.close()
 
 
 def init_app():
-    app = web.Application()
-    app.middlewares.append(compression_middleware)
+    app = web.Application(client_max_size=settings.CLIENT_MAX_SIZE)
+    app.middlewares.append(metrics_middleware)
+    app.middlewares.append(compression_middleware(
+        min_size=settings.COMPRESSION_MIN_SIZE,
+        cache_size=settings.COMPRESSION_CACHE_SIZE,
+    ))
     app.add_routes(routes)
 
+    app['preview_cache'] = pages.PageCache(settings.PREVIEW_CACHE_SIZE)
+
     app.on_startup.append(init_storage)
     app.on_startup.append(init_clipper)
 
-    app.on_cleanup.append(close_storage)
+    # nothing is added unless enabled, so there is no cost otherwise
+    if settings.PROFILER_ENABLED:
+        app.router.add_get('/lnk/profile', profile)
+        app.on_startup.append(init_profiler)
+        app.on_cleanup.append(close_profiler)
+
+    # clip jobs are drained into storage, so it should be closed last
     app.on_cleanup.append(close_clipper)
+    app.on_cleanup.append(close_storage)
 
     return app
 
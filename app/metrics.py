@@ -0,0 +1,245 @@
+import time
+import bisect
+import functools
+import typing as t
+
+import constants as const
+
+from abc import ABC, abstractmethod
+
+# seconds, suits both local lookups and network calls
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0, 30.0,
+)
+
+LabelsType = tuple[str, ...]
+
+
+class _CounterChild:
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, value: int | float = 1):
+        self.value += value
+
+
+class _HistogramChild:
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric(ABC):
+
+    TYPE = ''
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: LabelsType = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+        self._children: dict[LabelsType, t.Any] = {}
+
+        if not labelnames:
+            self._children[()] = self._new_child()
+
+    def labels(self, *values: str) -> t.Any:
+        # children are kept, so callers could resolve them once up front
+        try:
+            return self._children[values]
+        except KeyError:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects {self.labelnames}')
+
+            child = self._children[values] = self._new_child()
+
+            return child
+
+    def render(self) -> t.Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.TYPE}'
+
+        for values, child in self._children.items():
+            yield from self._render_child(
+                dict(zip(self.labelnames, values)), child
+            )
+
+    @abstractmethod
+    def _new_child(self) -> t.Any:
+        pass
+
+    @abstractmethod
+    def _render_child(
+            self,
+            labels: dict[str, str],
+            child: t.Any
+    ) -> t.Iterator[str]:
+        pass
+
+
+class Counter(_Metric):
+
+    TYPE = 'counter'
+
+    def inc(self, value: int | float = 1):
+        self._children[()].inc(value)
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def _render_child(
+            self,
+            labels: dict[str, str],
+            child: _CounterChild
+    ) -> t.Iterator[str]:
+        yield f'{self.name}{_labels(labels)} {child.value}'
+
+
+class Histogram(_Metric):
+
+    TYPE = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: LabelsType = (),
+            buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.buckets = tuple(sorted(buckets))
+
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def _render_child(
+            self,
+            labels: dict[str, str],
+            child: _HistogramChild
+    ) -> t.Iterator[str]:
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), child.counts):
+            cumulative += count
+            yield f'{self.name}_bucket{_labels({**labels, "le": str(bound)})} {cumulative}'  # noqa
+
+        yield f'{self.name}_sum{_labels(labels)} {child.sum}'
+        yield f'{self.name}_count{_labels(labels)} {child.count}'
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> t.Any:
+        self._metrics.append(metric)
+
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        lines.append('')
+
+        return '\n'.join(lines)
+
+
+def timed(histogram: _HistogramChild | Histogram) -> t.Callable:
+    def decorator(func: t.Callable) -> t.Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def _labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ''
+
+    pairs = ','.join(
+        f'{k}="{_escape(v)}"' for k, v in labels.items()
+    )
+
+    return f'{{{pairs}}}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')  # noqa
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    f'{const.LNK}_requests_total',
+    'HTTP requests by route and status',
+    ('route', 'status'),
+))
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    f'{const.LNK}_request_duration_seconds',
+    'HTTP request handling time by route',
+    ('route',),
+))
+
+LOOP_LAG = REGISTRY.register(Histogram(
+    f'{const.LNK}_event_loop_lag_seconds',
+    'Event loop scheduling delay, recorded when profiler is enabled',
+))
+
+STORAGE_DURATION = REGISTRY.register(Histogram(
+    f'{const.LNK}_storage_command_duration_seconds',
+    'Storage command time by command',
+    ('command',),
+))
+STORAGE_BYTES = REGISTRY.register(Counter(
+    f'{const.LNK}_storage_bytes_total',
+    'Storage payload bytes by direction',
+    ('direction',),
+))
+
+CLIPPER_DURATION = REGISTRY.register(Histogram(
+    f'{const.LNK}_clipper_duration_seconds',
+    'Clipper call time including retries',
+))
+CLIPPER_RETRIES = REGISTRY.register(Counter(
+    f'{const.LNK}_clipper_retries_total',
+    'Clipper call retries',
+))
+CLIPPER_FAILURES = REGISTRY.register(Counter(
+    f'{const.LNK}_clipper_failures_total',
+    'Clipper calls failed after all retries',
+))
+CLIPPER_REJECTED = REGISTRY.register(Counter(
+    f'{const.LNK}_clipper_rejected_total',
+    'Clipper calls rejected by open circuit breaker',
+))
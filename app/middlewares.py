@@ -1,9 +1,23 @@
+import os
+import gzip
+import time
+import zlib
+import hashlib
+import mimetypes
 import typing as t
 
+import brotli
+
+import metrics
+
+from collections import OrderedDict
+
 from aiohttp import hdrs
 from aiohttp.web import (
     middleware,
+    HTTPException,
     Request,
+    StaticResource,
     StreamResponse,
     Response,
     ContentCoding,
@@ -12,23 +26,161 @@ from aiohttp.web import (
 HandlerType = t.Callable[[t.Any], t.Coroutine[t.Any, None, Response]]
 
 
-# idea from https://github.com/mosquito/aiohttp-compress
+# already compressed formats gain nothing from another pass
+INCOMPRESSIBLE_TYPES = (
+    'image/', 'video/', 'audio/', 'font/woff', 'application/zip',
+    'application/gzip', 'application/x-gzip', 'application/octet-stream',
+)
+COMPRESSORS: dict[str, t.Callable[[bytes], bytes]] = {
+    'br': lambda body: brotli.compress(body, quality=5),
+    ContentCoding.gzip.value: lambda body: gzip.compress(body, compresslevel=6),  # noqa
+    ContentCoding.deflate.value: lambda body: zlib.compress(body, 6),
+}
+
+
+class CompressedCache:
+
+    def __init__(self, size: int = 256):
+        self.size = size
+
+        # compressed bodies by content hash and coding
+        self._bodies: OrderedDict[tuple[bytes, str], bytes] = OrderedDict()
+
+    def compress(self, body: bytes, coding: str) -> bytes:
+        key = (hashlib.blake2b(body, digest_size=16).digest(), coding)
+
+        try:
+            compressed = self._bodies[key]
+        except KeyError:
+            compressed = COMPRESSORS[coding](body)
+
+            if self.size > 0:
+                self._bodies[key] = compressed
+
+                while len(self._bodies) > self.size:
+                    self._bodies.popitem(last=False)
+        else:
+            self._bodies.move_to_end(key)
+
+        return compressed
+
+
+def compression_middleware(
+        min_size: int = 1024,
+        cache_size: int = 256
+) -> t.Callable:
+    cache = CompressedCache(cache_size)
+
+    # idea from https://github.com/mosquito/aiohttp-compress
+    @middleware
+    async def compression(
+            request: Request,
+            handler: HandlerType
+    ) -> StreamResponse:
+        accepted = _accepted_codings(request.headers.get(hdrs.ACCEPT_ENCODING, ''))  # noqa
+        if not accepted:
+            return await handler(request)
+
+        response = await handler(request)
+
+        # pre-compressed and already sent bodies are left as is
+        if response.prepared or hdrs.CONTENT_ENCODING in response.headers:
+            return response
+
+        if not isinstance(response, Response):
+            # streamed, size is unknown until sent
+            content_type, _ = mimetypes.guess_type(request.path)
+            if content_type and content_type.startswith(INCOMPRESSIBLE_TYPES):
+                return response
+
+            size = _file_size(response)
+            if size is not None and size < min_size:
+                return response
+
+            # aiohttp streams gzip and deflate only
+            for coding in (ContentCoding.gzip, ContentCoding.deflate):
+                if coding.value in accepted:
+                    response.enable_compression(coding)
+
+                    break
+
+            return response
+
+        body = response.body
+        if not isinstance(body, bytes) or len(body) < min_size:
+            return response
+
+        if response.content_type.startswith(INCOMPRESSIBLE_TYPES):
+            return response
+
+        coding = next(c for c in COMPRESSORS if c in accepted)
+
+        response.body = cache.compress(body, coding)
+        response.headers[hdrs.CONTENT_ENCODING] = coding
+        if hdrs.ACCEPT_ENCODING.lower() not in response.headers.get(hdrs.VARY, '').lower():  # noqa
+            response.headers.add(hdrs.VARY, hdrs.ACCEPT_ENCODING)
+
+        # encoded representation is not byte equal to the original one
+        etag = response.headers.get(hdrs.ETAG)
+        if etag and not etag.startswith('W/'):
+            response.headers[hdrs.ETAG] = f'W/{etag}'
+
+        return response
+
+    return compression
+
+
+def _file_size(response: StreamResponse) -> int | None:
+    # file response knows its path before it is sent
+    path = getattr(response, '_path', None)
+    if path is None:
+        return None
+
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+
+def _accepted_codings(accept_encoding: str) -> set[str]:
+    accepted = set()
+
+    for item in accept_encoding.lower().split(','):
+        coding, _, params = item.partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):  # noqa
+            continue
+
+        accepted.add(coding.strip())
+
+    return accepted & COMPRESSORS.keys()
+
+
 @middleware
-async def compression_middleware(
+async def metrics_middleware(
         request: Request,
         handler: HandlerType
 ) -> StreamResponse:
-    accept_encoding = request.headers.get(hdrs.ACCEPT_ENCODING, '').lower()
-
-    if ContentCoding.gzip.value in accept_encoding:
-        compressor = ContentCoding.gzip.value
-    elif ContentCoding.deflate.value in accept_encoding:
-        compressor = ContentCoding.deflate.value
+    match_info = request.match_info
+    if match_info.http_exception is not None:
+        route = 'unmatched'
+    elif isinstance(match_info.route.resource, StaticResource):
+        route = 'static'
     else:
-        return await handler(request)
+        route = match_info.handler.__name__
+
+    status = 500
+    start = time.perf_counter()
+    try:
+        response = await handler(request)
+        status = response.status
+    except HTTPException as e:
+        status = e.status
 
-    response = await handler(request)
-    response.headers[hdrs.CONTENT_ENCODING] = compressor
-    response.enable_compression()
+        raise
+    finally:
+        metrics.REQUEST_DURATION.labels(route).observe(
+            time.perf_counter() - start
+        )
+        metrics.REQUESTS.labels(route, str(status)).inc()
 
     return response
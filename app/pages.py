@@ -0,0 +1,124 @@
+import re
+import hashlib
+import typing as t
+
+from collections import OrderedDict
+
+from aiohttp import web
+
+from utils import chunked
+
+# quoted etags may hold commas, so the list isn't just split by them
+_ETAG_RE = re.compile(r'\*|(?:W/)?"[^"]*"')
+
+
+class RenderedPage:
+
+    __slots__ = ('body', 'etag')
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses weak comparison, compression middleware weakens
+    # etags of compressed responses
+    tag = etag.removeprefix('W/')
+
+    for candidate in _ETAG_RE.findall(if_none_match):
+        if candidate == '*' or candidate.removeprefix('W/') == tag:
+            return True
+
+    return False
+
+
+class PageCache:
+
+    def __init__(self, size: int = 256):
+        self.size = size
+
+        self.hits = 0
+        self.misses = 0
+
+        # one page per uid, variant tells whether it is still current
+        self._pages: OrderedDict[str, tuple[t.Hashable, RenderedPage]] = OrderedDict()  # noqa
+
+    def get(self, uid: str, variant: t.Hashable) -> RenderedPage | None:
+        try:
+            cached_variant, page = self._pages[uid]
+        except KeyError:
+            self.misses += 1
+
+            return None
+
+        if cached_variant != variant:
+            del self._pages[uid]
+            self.misses += 1
+
+            return None
+
+        self._pages.move_to_end(uid)
+        self.hits += 1
+
+        return page
+
+    def set(self, uid: str, variant: t.Hashable, page: RenderedPage):
+        if self.size <= 0:
+            return
+
+        self._pages[uid] = (variant, page)
+        self._pages.move_to_end(uid)
+
+        while len(self._pages) > self.size:
+            self._pages.popitem(last=False)
+
+    def invalidate(self, uid: str):
+        self._pages.pop(uid, None)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._pages),
+        }
+
+
+def is_large(clip: dict[str, str] | None, threshold: int) -> bool:
+    if not clip:
+        return False
+
+    # both views of a large clip are streamed, whichever field is large
+    size = max(len(clip.get('content', '')), len(clip.get('textContent', '')))  # noqa
+
+    return size > threshold
+
+
+async def stream_page(
+        request: web.Request,
+        headers: dict[str, str],
+        fragments: t.Iterable[str] | t.AsyncIterable[str],
+        chunk_size: int
+) -> web.StreamResponse:
+    response = web.StreamResponse(status=200, headers=headers)
+    response.content_type = 'text/html'
+    response.charset = 'utf-8'
+    response.enable_compression()
+
+    await response.prepare(request)
+
+    # clip itself is loaded whole, but its encoded and compressed body is
+    # never built, only a chunk of it is encoded at a time
+    if isinstance(fragments, t.AsyncIterable):
+        async for fragment in fragments:
+            for chunk in chunked(fragment, chunk_size):
+                await response.write(chunk.encode())
+    else:
+        for fragment in fragments:
+            for chunk in chunked(fragment, chunk_size):
+                await response.write(chunk.encode())
+
+    await response.write_eof()
+
+    return response
@@ -0,0 +1,148 @@
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+import collections
+import typing as t
+
+import metrics
+import constants as const
+
+from exceptions import ProfilingInProgress
+
+log = logging.getLogger(const.LNK)
+
+
+class LoopMonitor:
+
+    def __init__(
+            self,
+            interval: int | float = 0.5,
+            slow_threshold: int | float = 0.1,
+            _timer: t.Callable[[], float] = time.monotonic
+    ):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+
+        self._timer = _timer
+        self._heartbeat = 0.0
+        self._loop_thread_id: t.Optional[int] = None
+        self._task: t.Optional[asyncio.Task] = None
+        self._watchdog: t.Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._heartbeat = self._timer()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+
+        self._task = asyncio.create_task(self._monitor())
+        self._watchdog = threading.Thread(
+            target=self._watch, name=f'{const.LNK}-loop-watchdog', daemon=True
+        )
+        self._watchdog.start()
+
+    async def close(self):
+        self._stopped.set()
+
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+        self._task = None
+
+    async def _monitor(self):
+        while True:
+            start = self._timer()
+            await asyncio.sleep(self.interval)
+            now = self._timer()
+
+            lag = max(now - start - self.interval, 0)
+            self._heartbeat = now
+
+            metrics.LOOP_LAG.observe(lag)
+
+            if lag >= self.slow_threshold:
+                log.warning('event loop lagged for %.3fs', lag)
+
+    def _watch(self):
+        reported = None
+
+        # loop thread is sampled from outside, while it is still blocked
+        while not self._stopped.wait(self.slow_threshold / 2):
+            heartbeat = self._heartbeat
+            if self._timer() - heartbeat < self.interval + self.slow_threshold:  # noqa
+                continue
+
+            if reported == heartbeat:
+                continue
+            reported = heartbeat
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+
+            log.warning(
+                'event loop blocked for more than %.3fs at:\n%s',
+                self.slow_threshold,
+                ''.join(traceback.format_stack(frame)),
+            )
+
+
+class SamplingProfiler:
+
+    def __init__(self, interval: float = 0.005, max_seconds: int = 60):
+        self.interval = interval
+        self.max_seconds = max_seconds
+
+        self._lock = threading.Lock()
+
+    async def profile(self, seconds: int | float) -> str:
+        seconds = min(seconds, self.max_seconds)
+
+        if not self._lock.acquire(blocking=False):
+            raise ProfilingInProgress()
+
+        try:
+            stacks = await asyncio.get_running_loop().run_in_executor(
+                None, self._sample, seconds
+            )
+        finally:
+            self._lock.release()
+
+        return fold(stacks)
+
+    def _sample(self, seconds: int | float) -> collections.Counter:
+        stacks: collections.Counter = collections.Counter()
+        sampler_id = threading.get_ident()
+        names = {th.ident: th.name for th in threading.enumerate()}
+
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_id:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'  # noqa
+                    )
+                    frame = frame.f_back
+
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks[tuple(reversed(stack))] += 1
+
+            time.sleep(self.interval)
+
+        return stacks
+
+
+def fold(stacks: collections.Counter) -> str:
+    # collapsed stacks format of flamegraph.pl and speedscope
+    return ''.join(
+        f'{";".join(stack)} {count}\n' for stack, count in stacks.most_common()
+    )
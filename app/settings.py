@@ -1,20 +1,109 @@
 import os
+import socket
 
 from pathlib import Path
 
+from utils import str2bool
+
 TOKEN = os.environ['TOKEN']
 if not TOKEN:
     raise EnvironmentError('token should be valid string')
 
 HOST, PORT = os.getenv('HOST', '0.0.0.0'), int(os.getenv('PORT', '8010'))
+CLIENT_MAX_SIZE = int(os.getenv('CLIENT_MAX_SIZE', str(16 * 1024 * 1024)))
+BULK_MAX_SIZE = int(os.getenv('BULK_MAX_SIZE', '50000'))
+
+# redis, sqlite or memory
+STORAGE = os.getenv('STORAGE', 'redis')
+
+MEMORY_MAX_BYTES = int(os.getenv('MEMORY_MAX_BYTES', str(256 * 1024 * 1024)))
+# loaded on startup and saved on shutdown if set
+MEMORY_SNAPSHOT_PATH = os.getenv('MEMORY_SNAPSHOT_PATH', '')
+
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'lnk.db')
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
 
 REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
-REDIS_PORT = os.getenv('REDIS_PORT')
+REDIS_PORT = int(os.getenv('REDIS_PORT', '6379'))
+# standalone, cluster or sentinel
+REDIS_MODE = os.getenv('REDIS_MODE', 'standalone')
+# comma separated host:port pairs, used by sentinel mode
+REDIS_SENTINELS = [
+    (host, int(port))
+    for host, port in (
+        s.rsplit(':', 1) for s in os.getenv('REDIS_SENTINELS', '').split(',') if s  # noqa
+    )
+]
+REDIS_SENTINEL_SERVICE = os.getenv('REDIS_SENTINEL_SERVICE', 'mymaster')
+# 0 means client default
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', '0'))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', '5'))
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', '2'))
+REDIS_SOCKET_KEEPALIVE = str2bool(os.getenv('REDIS_SOCKET_KEEPALIVE', 'true'))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', '30'))  # noqa
+REDIS_AUTO_BATCH = str2bool(os.getenv('REDIS_AUTO_BATCH', 'true'))
+
+# values of clip keys, urls are stored as plain text
+SERIALIZER_CODEC = os.getenv('SERIALIZER_CODEC', 'zstd')
+# dictionary trained with `zstd --train`, used by zstd codec
+SERIALIZER_ZSTD_DICT = os.getenv('SERIALIZER_ZSTD_DICT', '')
+# payloads of this size in bytes are (de)serialized in threads, 0 disables
+SERIALIZER_OFFLOAD_THRESHOLD = int(os.getenv('SERIALIZER_OFFLOAD_THRESHOLD', str(64 * 1024)))  # noqa
+SERIALIZER_OFFLOAD_WORKERS = int(os.getenv('SERIALIZER_OFFLOAD_WORKERS', '4'))
+
+CACHE_SIZE = int(os.getenv('CACHE_SIZE', '1024'))
+CACHE_TTL = int(os.getenv('CACHE_TTL', '300'))
+# unknown keys are remembered for that long, 0 disables
+CACHE_NEGATIVE_TTL = int(os.getenv('CACHE_NEGATIVE_TTL', '5'))
+CACHE_INVALIDATION = str2bool(os.getenv('CACHE_INVALIDATION', 'true'))
 
 CLIPPER_URL = os.getenv('CLIPPER_URL', '')
 CLIPPER_TOKEN = os.getenv('CLIPPER_TOKEN', '')
+CLIPPER_CONNECTIONS = int(os.getenv('CLIPPER_CONNECTIONS', '100'))
+# 0 means no per host limit
+CLIPPER_CONNECTIONS_PER_HOST = int(os.getenv('CLIPPER_CONNECTIONS_PER_HOST', '0'))  # noqa
+# 0 disables dns caching
+CLIPPER_DNS_TTL = int(os.getenv('CLIPPER_DNS_TTL', '300'))
+CLIPPER_KEEPALIVE_TIMEOUT = int(os.getenv('CLIPPER_KEEPALIVE_TIMEOUT', '30'))
+# clips of recently clipped urls are reused, 0 disables
+CLIPPER_CACHE_SIZE = int(os.getenv('CLIPPER_CACHE_SIZE', '1024'))
+CLIPPER_CACHE_TTL = int(os.getenv('CLIPPER_CACHE_TTL', '60'))
+CLIPPER_RETRIES = int(os.getenv('CLIPPER_RETRIES', '3'))
+# retry delays grow exponentially from base up to max, randomized by jitter
+CLIPPER_BACKOFF_BASE = float(os.getenv('CLIPPER_BACKOFF_BASE', '0.5'))
+CLIPPER_BACKOFF_MAX = float(os.getenv('CLIPPER_BACKOFF_MAX', '10'))
+# consecutive failures to open the breaker and seconds until it is probed
+CLIPPER_BREAKER_THRESHOLD = int(os.getenv('CLIPPER_BREAKER_THRESHOLD', '5'))
+CLIPPER_BREAKER_RESET_TIMEOUT = float(os.getenv('CLIPPER_BREAKER_RESET_TIMEOUT', '30'))  # noqa
+# urls collected for batch delay seconds or up to batch size are clipped
+# in one request to batch path, clipper url path with /batch by default
+CLIPPER_BATCH_SIZE = int(os.getenv('CLIPPER_BATCH_SIZE', '0'))
+CLIPPER_BATCH_DELAY = float(os.getenv('CLIPPER_BATCH_DELAY', '0.005'))
+CLIPPER_BATCH_PATH = os.getenv('CLIPPER_BATCH_PATH', '')
+CLIP_QUEUE = os.getenv('CLIP_QUEUE', 'local')
+CLIP_WORKER_ID = os.getenv('CLIP_WORKER_ID', socket.gethostname())
+CLIP_WORKERS = int(os.getenv('CLIP_WORKERS', '8'))
+CLIP_QUEUE_SIZE = int(os.getenv('CLIP_QUEUE_SIZE', '1024'))
+CLIP_QUEUE_OVERFLOW = os.getenv('CLIP_QUEUE_OVERFLOW', 'skip')
+CLIP_DRAIN_TIMEOUT = int(os.getenv('CLIP_DRAIN_TIMEOUT', '30'))
+# jobs of a worker silent for this long are requeued by others
+CLIP_HEARTBEAT_TTL = int(os.getenv('CLIP_HEARTBEAT_TTL', '30'))
+# failed clip of a viewed link is resubmitted at most once per interval
+CLIP_RETRY_INTERVAL = int(os.getenv('CLIP_RETRY_INTERVAL', '60'))
 
 CWD = Path.cwd()
+# smaller responses are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+# compressed bodies kept by content hash, 0 disables
+COMPRESSION_CACHE_SIZE = int(os.getenv('COMPRESSION_CACHE_SIZE', '256'))
+
+# clip bodies of that many characters are streamed in chunks
+STREAM_THRESHOLD = int(os.getenv('STREAM_THRESHOLD', str(256 * 1024)))
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', str(64 * 1024)))
+
+# rendered preview pages kept in memory, 0 disables
+PREVIEW_CACHE_SIZE = int(os.getenv('PREVIEW_CACHE_SIZE', '256'))
+
 TEMPLATE_PATH = CWD / 'templates'
 REDIRECT_TEMPLATE_FILENAME = 'redirect.html'
 BASE_TEMPLATE_FILENAME = 'base.html'
@@ -22,6 +111,13 @@ EMPTY_TEMPLATE_FILENAME = 'empty.html'
 HTML_CONTENT_TEMPLATE_FILENAME = 'html.html'
 STATIC_PATH = CWD / 'static'
 
+# loop lag monitor, blocked loop stacks and /lnk/profile endpoint
+PROFILER_ENABLED = str2bool(os.getenv('PROFILER_ENABLED', 'false'))
+PROFILER_LAG_INTERVAL = float(os.getenv('PROFILER_LAG_INTERVAL', '0.5'))
+PROFILER_SLOW_THRESHOLD = float(os.getenv('PROFILER_SLOW_THRESHOLD', '0.1'))
+PROFILER_SAMPLE_INTERVAL = float(os.getenv('PROFILER_SAMPLE_INTERVAL', '0.005'))  # noqa
+PROFILER_MAX_SECONDS = int(os.getenv('PROFILER_MAX_SECONDS', '60'))
+
 LOG_FORMAT = '%(asctime)s [%(levelname)s] %(filename)s:%(lineno)d %(message)s'
 LOG_DATEFMT = '%Y-%m-%dT%H:%M:%S'
 
@@ -1,14 +1,50 @@
 import typing as t
 import gzip
+import time
+import asyncio
+import contextlib
+import copy
+import logging
+import os
+import math
+import heapq
+import sqlite3
+import itertools
+import threading
+import uuid
 
+from concurrent.futures import ThreadPoolExecutor
+
+import lz4.frame
 import ujson
+import zstandard
 import redis.asyncio as aioredis
 
+import metrics
+import constants as const
+
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from utils import Batcher
+
+log = logging.getLogger(const.LNK)
+
+_MISSING = object()
+
+ItemType = tuple[t.Any, t.Any, t.Optional[int | float]]
+
+_READ_BYTES = metrics.STORAGE_BYTES.labels('read')
+_WRITTEN_BYTES = metrics.STORAGE_BYTES.labels('written')
+
+# value, local expiration time and storage expiration time if any
+_CacheEntry = tuple[t.Any, float, t.Optional[float]]
 
 
 class BaseSerializer(ABC):
 
+    TAG: bytes = b''
+
     @abstractmethod
     def dumps(self, obj: t.Any) -> bytes | None:
         pass
@@ -18,8 +54,43 @@ class BaseSerializer(ABC):
         pass
 
 
+class RawSerializer(BaseSerializer):
+
+    TAG = b'r'
+
+    def dumps(self, obj: t.Any) -> bytes | None:
+        if obj is None:
+            return None
+
+        return obj.encode('utf-8')
+
+    def loads(self, data: bytes | None) -> t.Any:
+        if data is None:
+            return None
+
+        return str(data, 'utf-8')
+
+
+class JsonSerializer(BaseSerializer):
+
+    TAG = b'j'
+
+    def dumps(self, obj: t.Any) -> bytes | None:
+        if obj is None:
+            return None
+
+        return ujson.dumps(obj).encode('utf-8')
+
+    def loads(self, data: bytes | None) -> t.Any:
+        if data is None:
+            return None
+
+        return ujson.loads(bytes(data))
+
+
 class GzipJsonSerializer(BaseSerializer):
 
+    TAG = b'g'
     DEFAULT_COMPRESSLEVEL = 8
 
     def dumps(self, obj: t.Any) -> bytes | None:
@@ -38,6 +109,152 @@ class GzipJsonSerializer(BaseSerializer):
         return ujson.loads(gzip.decompress(data))
 
 
+class ZstdJsonSerializer(BaseSerializer):
+
+    TAG = b'z'
+    DEFAULT_COMPRESSLEVEL = 3
+
+    def __init__(
+            self,
+            level: int = DEFAULT_COMPRESSLEVEL,
+            dictionary: t.Optional[bytes] = None
+    ):
+        self.level = level
+
+        self._dict_data = None
+        if dictionary is not None:
+            self._dict_data = zstandard.ZstdCompressionDict(dictionary)
+
+        # zstd contexts aren't thread safe, large values are offloaded
+        # to a thread pool, so every thread gets its own pair
+        self._local = threading.local()
+
+    def dumps(self, obj: t.Any) -> bytes | None:
+        if obj is None:
+            return None
+
+        return self._contexts()[0].compress(ujson.dumps(obj).encode('utf-8'))
+
+    def loads(self, data: bytes | None) -> t.Any:
+        if data is None:
+            return None
+
+        return ujson.loads(self._contexts()[1].decompress(data))
+
+    def _contexts(self) -> tuple[zstandard.ZstdCompressor, zstandard.ZstdDecompressor]:  # noqa
+        try:
+            return self._local.contexts
+        except AttributeError:
+            contexts = self._local.contexts = (
+                zstandard.ZstdCompressor(
+                    level=self.level, dict_data=self._dict_data
+                ),
+                zstandard.ZstdDecompressor(dict_data=self._dict_data),
+            )
+
+            return contexts
+
+
+class Lz4JsonSerializer(BaseSerializer):
+
+    TAG = b'l'
+    DEFAULT_COMPRESSLEVEL = 0
+
+    def __init__(self, level: int = DEFAULT_COMPRESSLEVEL):
+        self.level = level
+
+    def dumps(self, obj: t.Any) -> bytes | None:
+        if obj is None:
+            return None
+
+        return lz4.frame.compress(
+            ujson.dumps(obj).encode('utf-8'), compression_level=self.level
+        )
+
+    def loads(self, data: bytes | None) -> t.Any:
+        if data is None:
+            return None
+
+        return ujson.loads(lz4.frame.decompress(data))
+
+
+class TaggedSerializer(BaseSerializer):
+
+    # gzip streams start with these bytes, values without tag are legacy ones
+    GZIP_MAGIC = b'\x1f\x8b'
+
+    def __init__(
+            self,
+            text: t.Optional[BaseSerializer] = None,
+            obj: t.Optional[BaseSerializer] = None
+    ):
+        self.text = text or RawSerializer()
+        self.obj = obj or ZstdJsonSerializer()
+
+        self._legacy = GzipJsonSerializer()
+        self._serializers = {
+            s.TAG[0]: s
+            for s in (
+                RawSerializer(),
+                JsonSerializer(),
+                self._legacy,
+                ZstdJsonSerializer(),
+                Lz4JsonSerializer(),
+                self.text,
+                self.obj,
+            )
+        }
+
+    def dumps(self, obj: t.Any) -> bytes | None:
+        if obj is None:
+            return None
+
+        serializer = self.text if isinstance(obj, str) else self.obj
+
+        return serializer.TAG + serializer.dumps(obj)
+
+    def loads(self, data: bytes | None) -> t.Any:
+        if data is None:
+            return None
+
+        if data.startswith(self.GZIP_MAGIC):
+            return self._legacy.loads(data)
+
+        try:
+            serializer = self._serializers[data[0]]
+        except KeyError:
+            raise ValueError(f'unknown serialization format: {data[:1]!r}')
+
+        return serializer.loads(memoryview(data)[1:])
+
+
+OBJ_SERIALIZERS: dict[str, t.Callable[..., BaseSerializer]] = {
+    'json': JsonSerializer,
+    'gzip': GzipJsonSerializer,
+    'zstd': ZstdJsonSerializer,
+    'lz4': Lz4JsonSerializer,
+}
+
+
+def tagged_serializer(
+        codec: str = 'zstd',
+        dictionary_path: t.Optional[str] = None
+) -> TaggedSerializer:
+    if codec not in OBJ_SERIALIZERS:
+        raise ValueError(f'unsupported codec: {codec}')
+
+    if dictionary_path:
+        if codec != 'zstd':
+            raise ValueError('dictionary is supported by zstd codec only')
+
+        with open(dictionary_path, 'rb') as f:
+            obj = ZstdJsonSerializer(dictionary=f.read())
+    else:
+        obj = OBJ_SERIALIZERS[codec]()
+
+    return TaggedSerializer(obj=obj)
+
+
 class BaseStorage(ABC):
 
     @abstractmethod
@@ -48,19 +265,54 @@ class BaseStorage(ABC):
     async def multi_get(self, *keys: t.Any) -> t.Iterable[t.Any]:
         pass
 
+    @abstractmethod
+    async def multi_get_ttl(self, *keys: t.Any) -> list[tuple[t.Any, int]]:
+        pass
+
+    @abstractmethod
+    async def ttl(self, key: t.Any) -> int:
+        pass
+
+    @abstractmethod
+    async def multi_ttl(self, *keys: t.Any) -> list[int]:
+        pass
+
     @abstractmethod
     async def set(
             self,
             key: t.Any,
             value: t.Any,
-            ttl: t.Optional[int | float] = None
-    ):
+            ttl: t.Optional[int | float] = None,
+            nx: bool = False
+    ) -> bool:
+        pass
+
+    @abstractmethod
+    async def multi_set(
+            self,
+            items: t.Iterable[ItemType],
+            nx: bool = False
+    ) -> list[bool]:
         pass
 
     @abstractmethod
     async def multi_delete(self, *keys: t.Any) -> int:
         pass
 
+    @abstractmethod
+    async def set_shared(
+            self,
+            key: t.Any,
+            value: t.Any,
+            ref: str,
+            ttl: t.Optional[int | float] = None
+    ) -> bool:
+        pass
+
+    @abstractmethod
+    async def release_shared(self, key: t.Any, ref: str) -> bool:
+        pass
+
     @abstractmethod
     async def ping(self) -> bool:
         pass
@@ -69,9 +321,47 @@ class BaseStorage(ABC):
     async def close(self):
         pass
 
+    @property
+    def stats(self) -> dict[str, int]:
+        return {}
+
 
 class Redis(BaseStorage):
 
+    # refs of a shared value are kept in a sorted set by expiration time
+    # in ms, value and the set live as long as the last of them
+    _SHARED_PRELUDE = '''
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+'''
+    _SHARED_EXPIRE = '''
+local last = redis.call('ZRANGE', KEYS[2], -1, -1, 'WITHSCORES')
+if #last == 0 then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 0
+end
+if last[2] == 'inf' then
+    redis.call('PERSIST', KEYS[1])
+    redis.call('PERSIST', KEYS[2])
+else
+    redis.call('PEXPIREAT', KEYS[1], last[2])
+    redis.call('PEXPIREAT', KEYS[2], last[2])
+end
+return 1
+'''
+    SET_SHARED_SCRIPT = _SHARED_PRELUDE + '''
+if ARGV[3] == '' then
+    redis.call('ZADD', KEYS[2], 'inf', ARGV[2])
+else
+    redis.call('ZADD', KEYS[2], now + tonumber(ARGV[3]), ARGV[2])
+end
+redis.call('SET', KEYS[1], ARGV[1])
+''' + _SHARED_EXPIRE
+    RELEASE_SHARED_SCRIPT = _SHARED_PRELUDE + '''
+redis.call('ZREM', KEYS[2], ARGV[1])
+''' + _SHARED_EXPIRE
+
     def __init__(
             self,
             host: str,
@@ -79,55 +369,148 @@ class Redis(BaseStorage):
             decode_responses: bool = False,
             health_check_interval: int = 0,
             serializer: t.Optional[BaseSerializer] = None,
+            batch_size: int = 1000,
+            offload_threshold: t.Optional[int] = None,
+            offload_workers: int = 4,
+            max_connections: t.Optional[int] = None,
+            socket_timeout: t.Optional[float] = None,
+            socket_connect_timeout: t.Optional[float] = None,
+            socket_keepalive: bool = False,
+            auto_batch: bool = False,
             _client: t.Callable = aioredis.Redis
     ):
         self.host = host
         self.port = port or 6379
-        self.serializer = serializer
         self.decode_responses = decode_responses
         self.health_check_interval = health_check_interval
         self.serializer = serializer
+        self.batch_size = batch_size
+        self.offload_threshold = offload_threshold
+        self.offload_workers = offload_workers
+        self.max_connections = max_connections
+        self.socket_timeout = socket_timeout
+        self.socket_connect_timeout = socket_connect_timeout
+        self.socket_keepalive = socket_keepalive
+        self.auto_batch = auto_batch
+
+        # compression libraries release GIL, so threads are enough
+        self._executor: t.Optional[ThreadPoolExecutor] = None
+        if self.serializer is not None and self.offload_threshold is not None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.offload_workers,
+                thread_name_prefix=f'{const.LNK}-serializer',
+            )
+
+        # concurrent single key reads are coalesced into one round trip
+        self._get_batcher: t.Optional[Batcher] = None
+        self._get_ttl_batcher: t.Optional[Batcher] = None
+        if self.auto_batch:
+            self._get_batcher = Batcher(self._mget, self.batch_size)
+            self._get_ttl_batcher = Batcher(self._mget_ttl, self.batch_size)
 
         self._client = _client(
-            host=self.host,
-            port=self.port,
-            decode_responses=self.decode_responses,
-            health_check_interval=self.health_check_interval
+            host=self.host, port=self.port, **self._connection_options()
         )
 
+    @metrics.timed(metrics.STORAGE_DURATION.labels('get'))
     async def get(self, key: t.Any) -> t.Any:
-        value = await self._client.get(key)
+        if self._get_batcher is None:
+            return await self._loads(await self._client.get(key))
 
-        if self.serializer is not None:
-            return self.serializer.loads(value)
-
-        return value
+        return await self._loads((await self._get_batcher.load(key))[0])
 
+    @metrics.timed(metrics.STORAGE_DURATION.labels('mget'))
     async def multi_get(self, *keys: t.Any) -> t.Iterable[t.Any]:
-        values = await self._client.mget(*keys)
+        return await self._multi_loads(await self._mget(*keys))
+
+    @metrics.timed(metrics.STORAGE_DURATION.labels('mget_ttl'))
+    async def multi_get_ttl(self, *keys: t.Any) -> list[tuple[t.Any, int]]:
+        if self._get_ttl_batcher is None:
+            items = await self._mget_ttl(*keys)
+        else:
+            items = await self._get_ttl_batcher.load(*keys)
 
-        if self.serializer is not None:
-            return [self.serializer.loads(v) for v in values]
+        values = await self._multi_loads([value for value, _ in items])
 
-        return values
+        return [(value, ttl) for value, (_, ttl) in zip(values, items)]
 
+    @metrics.timed(metrics.STORAGE_DURATION.labels('ttl'))
     async def ttl(self, key: t.Any) -> int:
         return await self._client.ttl(key)
 
+    @metrics.timed(metrics.STORAGE_DURATION.labels('multi_ttl'))
+    async def multi_ttl(self, *keys: t.Any) -> list[int]:
+        batches = await asyncio.gather(*(
+            self._multi_ttl(keys[i:i+self.batch_size])
+            for i in range(0, len(keys), self.batch_size)
+        ))
+
+        return list(itertools.chain.from_iterable(batches))
+
+    @metrics.timed(metrics.STORAGE_DURATION.labels('set'))
     async def set(
             self,
             key: t.Any,
             value: t.Any,
-            ttl: t.Optional[int | float] = None
-    ):
-        if self.serializer is not None:
-            value = self.serializer.dumps(value)
+            ttl: t.Optional[int | float] = None,
+            nx: bool = False
+    ) -> bool:
+        value = await self._dumps(value)
 
-        await self._client.set(key, value, ex=ttl)
+        return bool(await self._client.set(key, value, ex=ttl, nx=nx))
 
+    @metrics.timed(metrics.STORAGE_DURATION.labels('multi_set'))
+    async def multi_set(
+            self,
+            items: t.Iterable[ItemType],
+            nx: bool = False
+    ) -> list[bool]:
+        items = iter(items)
+        written = []
+
+        while batch := list(itertools.islice(items, self.batch_size)):
+            values = await self._multi_dumps([v for _, v, _ in batch])
+
+            async with self._client.pipeline(transaction=False) as pipe:
+                for (key, _, ttl), value in zip(batch, values):
+                    pipe.set(key, value, ex=ttl, nx=nx)
+
+                written.extend(bool(r) for r in await pipe.execute())
+
+        return written
+
+    @metrics.timed(metrics.STORAGE_DURATION.labels('delete'))
     async def multi_delete(self, *keys: t.Any) -> int:
         return await self._client.delete(*keys)
 
+    @metrics.timed(metrics.STORAGE_DURATION.labels('set_shared'))
+    async def set_shared(
+            self,
+            key: t.Any,
+            value: t.Any,
+            ref: str,
+            ttl: t.Optional[int | float] = None
+    ) -> bool:
+        value = await self._dumps(value)
+
+        return bool(await self._client.eval(
+            self.SET_SHARED_SCRIPT,
+            2,
+            key,
+            _refs_key(key),
+            value,
+            ref,
+            '' if ttl is None else int(ttl * 1000),
+        ))
+
+    @metrics.timed(metrics.STORAGE_DURATION.labels('release_shared'))
+    async def release_shared(self, key: t.Any, ref: str) -> bool:
+        kept = await self._client.eval(
+            self.RELEASE_SHARED_SCRIPT, 2, key, _refs_key(key), ref
+        )
+
+        return not kept
+
     async def ping(self) -> bool:
         return await self._client.ping()
 
@@ -135,42 +518,1119 @@ class Redis(BaseStorage):
         if self._client is None:
             return
 
+        # batched reads in flight still need the client
+        for batcher in (self._get_batcher, self._get_ttl_batcher):
+            if batcher is not None:
+                await batcher.close()
+
         await self._client.close()
 
         self._client = None
 
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
 
-class Fake(BaseStorage):
+    async def _loads(self, data: bytes | None) -> t.Any:
+        return (await self._multi_loads([data]))[0]
 
-    def __init__(self):
-        self._storage = {}
+    async def _multi_loads(self, values: list[bytes | None]) -> list[t.Any]:
+        if self.serializer is None:
+            return values
 
-    async def get(self, key: t.Any) -> t.Any:
-        return self._storage.get(key)
+        sizes = [0 if v is None else len(v) for v in values]
+        _READ_BYTES.inc(sum(sizes))
 
-    async def multi_get(self, *keys: t.Any) -> t.Iterable[t.Any]:
-        return [self._storage.get(k) for k in keys]
+        return await self._serialize(self.serializer.loads, values, sizes)
 
-    async def set(
+    async def _dumps(self, value: t.Any) -> t.Any:
+        return (await self._multi_dumps([value]))[0]
+
+    async def _multi_dumps(self, values: list[t.Any]) -> list[t.Any]:
+        if self.serializer is None:
+            return values
+
+        sizes = [_estimate_size(v) for v in values]
+
+        dumped = await self._serialize(self.serializer.dumps, values, sizes)
+        _WRITTEN_BYTES.inc(sum(len(v) for v in dumped if v is not None))
+
+        return dumped
+
+    async def _serialize(
             self,
-            key: t.Any,
-            value: t.Any,
-            ttl: t.Optional[int | float] = None
+            func: t.Callable[[t.Any], t.Any],
+            values: list[t.Any],
+            sizes: list[int]
+    ) -> list[t.Any]:
+        if self._executor is None:
+            return [func(v) for v in values]
+
+        loop = asyncio.get_running_loop()
+        results = [
+            loop.run_in_executor(self._executor, func, v)
+            if size >= self.offload_threshold else func(v)
+            for v, size in zip(values, sizes)
+        ]
+
+        return [await r if isinstance(r, asyncio.Future) else r for r in results]  # noqa
+
+    async def _multi_ttl(self, keys: t.Sequence[t.Any]) -> list[int]:
+        async with self._client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.ttl(key)
+
+            return await pipe.execute()
+
+    async def _mget(self, *keys: t.Any) -> list[t.Any]:
+        return await self._client.mget(*keys)
+
+    async def _mget_ttl(self, *keys: t.Any) -> list[tuple[t.Any, int]]:
+        async with self._client.pipeline(transaction=False) as pipe:
+            pipe.mget(*keys)
+            for key in keys:
+                pipe.ttl(key)
+
+            values, *ttls = await pipe.execute()
+
+        return list(zip(values, ttls))
+
+    def _connection_options(self) -> dict[str, t.Any]:
+        options = {
+            'decode_responses': self.decode_responses,
+            'health_check_interval': self.health_check_interval,
+            'max_connections': self.max_connections,
+            'socket_timeout': self.socket_timeout,
+            'socket_connect_timeout': self.socket_connect_timeout,
+            'socket_keepalive': self.socket_keepalive,
+        }
+
+        # unset options are left to client defaults
+        return {k: v for k, v in options.items() if v is not None}
+
+
+class RedisCluster(Redis):
+
+    def __init__(self, host: str, port: t.Optional[int] = None, **kwargs):
+        kwargs.setdefault('_client', aioredis.RedisCluster)
+
+        super().__init__(host, port, **kwargs)
+
+    async def _mget(self, *keys: t.Any) -> list[t.Any]:
+        # keys are spread over slots, so MGET is split per slot
+        return await self._client.mget_nonatomic(keys)
+
+    async def _mget_ttl(self, *keys: t.Any) -> list[tuple[t.Any, int]]:
+        async with self._client.pipeline() as pipe:
+            for key in keys:
+                pipe.get(key)
+                pipe.ttl(key)
+
+            results = await pipe.execute()
+
+        return list(zip(results[::2], results[1::2]))
+
+
+class RedisSentinel(Redis):
+
+    def __init__(
+            self,
+            sentinels: list[tuple[str, int]],
+            service_name: str,
+            _sentinel: t.Callable = aioredis.sentinel.Sentinel,
+            **kwargs
     ):
-        self._storage[key] = value
+        self.sentinels = sentinels
+        self.service_name = service_name
 
-    async def multi_delete(self, *keys: t.Any) -> int:
-        deleted = 0
+        self._sentinel = None
 
-        for k in keys:
-            try:
-                del self._storage[k]
-            except KeyError:
-                continue
-            else:
-                deleted += 1
+        def _client(host: str, port: int, **options) -> aioredis.Redis:
+            self._sentinel = _sentinel(self.sentinels, **options)
 
-        return deleted
+            return self._sentinel.master_for(self.service_name)
 
-    async def ping(self) -> bool:
-        return True
+        kwargs['_client'] = _client
+
+        super().__init__(*sentinels[0], **kwargs)
+
+    async def close(self):
+        # master client doesn't own its sentinel managed pool
+        if self._client is not None:
+            await self._client.connection_pool.disconnect()
+
+        if self._sentinel is not None:
+            for sentinel in self._sentinel.sentinels:
+                await sentinel.close()
+
+            self._sentinel = None
+
+        await super().close()
+
+
+def redis_storage(
+        mode: str,
+        host: str,
+        port: t.Optional[int] = None,
+        sentinels: t.Optional[list[tuple[str, int]]] = None,
+        service_name: t.Optional[str] = None,
+        **kwargs
+) -> Redis:
+    if mode == 'standalone':
+        return Redis(host, port, **kwargs)
+
+    if mode == 'cluster':
+        return RedisCluster(host, port, **kwargs)
+
+    if mode == 'sentinel':
+        if not sentinels or not service_name:
+            raise ValueError('sentinels and service name are required')
+
+        return RedisSentinel(sentinels, service_name, **kwargs)
+
+    raise ValueError(f'unknown redis mode: {mode}')
+
+
+def _refs_key(key: t.Any) -> str:
+    # same hash tag as the value key, so both land on one cluster slot
+    return f'{key}:refs'
+
+
+def _live_refs(
+        refs: t.Optional[dict[str, t.Optional[float]]],
+        now: float
+) -> dict[str, t.Optional[float]]:
+    return {r: e for r, e in (refs or {}).items() if e is None or e > now}
+
+
+def _refs_expires_at(
+        refs: dict[str, t.Optional[float]]
+) -> t.Optional[float]:
+    if any(e is None for e in refs.values()):
+        return None
+
+    return max(refs.values())
+
+
+async def _update_shared(
+        storage: BaseStorage,
+        key: t.Any,
+        value: t.Any,
+        ref: str,
+        ttl: t.Optional[int | float],
+        now: float
+) -> bool:
+    # atomic only for storages which never yield to the loop inside
+    refs_key = _refs_key(key)
+    refs = _live_refs(await storage.get(refs_key), now)
+
+    if value is _MISSING:
+        refs.pop(ref, None)
+        value = await storage.get(key)
+    else:
+        refs[ref] = None if ttl is None else now + ttl
+
+    if not refs:
+        await storage.multi_delete(key, refs_key)
+
+        return False
+
+    expires_at = _refs_expires_at(refs)
+    ttl = None if expires_at is None else expires_at - now
+
+    items = [(refs_key, refs, ttl)]
+    if value is not None:
+        items.append((key, value, ttl))
+    await storage.multi_set(items)
+
+    return True
+
+
+def _estimate_size(value: t.Any) -> int:
+    if isinstance(value, (str, bytes)):
+        return len(value)
+
+    # clip payloads are flat dicts with a few large text fields
+    if isinstance(value, dict):
+        return sum(_estimate_size(v) for v in value.values())
+
+    return 0
+
+
+class BaseInvalidationBus(ABC):
+
+    @abstractmethod
+    async def publish(self, *keys: t.Any):
+        pass
+
+    @abstractmethod
+    async def listen(self, callback: t.Callable[..., t.Any]):
+        pass
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+
+class RedisInvalidationBus(BaseInvalidationBus):
+
+    def __init__(
+            self,
+            host: str,
+            port: t.Optional[int] = None,
+            channel: str = const.INVALIDATION_CHANNEL,
+            _client: t.Callable = aioredis.Redis
+    ):
+        self.host = host
+        self.port = port or 6379
+        self.channel = channel
+
+        # own messages are skipped, local cache is already up to date
+        self.node_id = uuid.uuid4().hex
+
+        self._client = _client(host=self.host, port=self.port)
+
+    async def publish(self, *keys: t.Any):
+        await self._client.publish(
+            self.channel, ujson.dumps({'node': self.node_id, 'keys': keys})
+        )
+
+    async def listen(self, callback: t.Callable[..., t.Any]):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+
+        try:
+            await pubsub.subscribe(self.channel)
+
+            async for message in pubsub.listen():
+                if message['type'] != 'message':
+                    continue
+
+                data = ujson.loads(message['data'])
+
+                # nodes not upgraded yet publish bare list of keys
+                if isinstance(data, list):
+                    callback(*data)
+                elif data.get('node') != self.node_id:
+                    callback(*data.get('keys', ()))
+        finally:
+            await pubsub.close()
+
+    async def close(self):
+        if self._client is None:
+            return
+
+        # sentinel master client doesn't own its pool
+        await self._client.close()
+        await self._client.connection_pool.disconnect()
+
+        self._client = None
+
+
+class Sqlite(BaseStorage):
+
+    # bound parameters limit of old sqlite builds is 999
+    CHUNK_SIZE = 500
+
+    SET_QUERY = (
+        'INSERT INTO storage (key, value, expires_at) VALUES (?, ?, ?) '
+        'ON CONFLICT (key) DO UPDATE SET '
+        'value = excluded.value, expires_at = excluded.expires_at'
+    )
+    # expired keys are free to take even if not purged yet
+    SET_NX_QUERY = f'{SET_QUERY} WHERE expires_at <= ?'
+
+    def __init__(
+            self,
+            path: str,
+            serializer: t.Optional[BaseSerializer] = None,
+            mmap_size: int = 256 * 1024 * 1024,
+            busy_timeout: int = 5000,
+            purge_interval: int | float = 60,
+            _timer: t.Callable[[], float] = time.time
+    ):
+        self.path = path
+        self.serializer = serializer
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self.purge_interval = purge_interval
+
+        self._timer = _timer
+        self._next_purge = 0.0
+
+        # WAL lets readers of any process work alongside the single writer
+        self._writer = self._connect()
+        self._writer.execute('PRAGMA journal_mode=WAL')
+        self._writer.execute(
+            'CREATE TABLE IF NOT EXISTS storage ('
+            'key TEXT PRIMARY KEY, value BLOB, expires_at REAL'
+            ') WITHOUT ROWID'
+        )
+        self._writer.execute(
+            'CREATE INDEX IF NOT EXISTS storage_expires_at '
+            'ON storage (expires_at) WHERE expires_at IS NOT NULL'
+        )
+        self._reader = self._connect()
+
+        # reads are served inline, writes wait for locks in a thread
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f'{const.LNK}-sqlite'
+        )
+
+    async def get(self, key: t.Any) -> t.Any:
+        return (await self.multi_get(key))[0]
+
+    async def multi_get(self, *keys: t.Any) -> t.Iterable[t.Any]:
+        return [value for value, _ in await self.multi_get_ttl(*keys)]
+
+    async def multi_get_ttl(self, *keys: t.Any) -> list[tuple[t.Any, int]]:
+        now = self._timer()
+        rows = {}
+
+        for i in range(0, len(keys), self.CHUNK_SIZE):
+            chunk = keys[i:i+self.CHUNK_SIZE]
+            rows.update(
+                (key, (value, expires_at))
+                for key, value, expires_at in self._reader.execute(
+                    'SELECT key, value, expires_at FROM storage '
+                    f'WHERE key IN ({", ".join("?" * len(chunk))}) '
+                    'AND (expires_at IS NULL OR expires_at > ?)',
+                    (*chunk, now)
+                )
+            )
+
+        items = []
+        for key in keys:
+            value, expires_at = rows.get(key, (None, _MISSING))
+            if expires_at is _MISSING:
+                items.append((None, -2))
+            elif expires_at is None:
+                items.append((self._loads(value), -1))
+            else:
+                items.append((self._loads(value), math.ceil(expires_at - now)))  # noqa
+
+        return items
+
+    async def ttl(self, key: t.Any) -> int:
+        return (await self.multi_ttl(key))[0]
+
+    async def multi_ttl(self, *keys: t.Any) -> list[int]:
+        return [ttl for _, ttl in await self.multi_get_ttl(*keys)]
+
+    async def set(
+            self,
+            key: t.Any,
+            value: t.Any,
+            ttl: t.Optional[int | float] = None,
+            nx: bool = False
+    ) -> bool:
+        return (await self.multi_set([(key, value, ttl)], nx=nx))[0]
+
+    async def multi_set(
+            self,
+            items: t.Iterable[ItemType],
+            nx: bool = False
+    ) -> list[bool]:
+        return await self._write(self._multi_set, list(items), nx)
+
+    async def multi_delete(self, *keys: t.Any) -> int:
+        return await self._write(self._multi_delete, keys)
+
+    async def set_shared(
+            self,
+            key: t.Any,
+            value: t.Any,
+            ref: str,
+            ttl: t.Optional[int | float] = None
+    ) -> bool:
+        return await self._write(self._update_shared, key, value, ref, ttl)
+
+    async def release_shared(self, key: t.Any, ref: str) -> bool:
+        return not await self._write(
+            self._update_shared, key, _MISSING, ref, None
+        )
+
+    async def ping(self) -> bool:
+        return self._reader.execute('SELECT 1').fetchone() == (1,)
+
+    async def close(self):
+        if self._reader is None:
+            return
+
+        self._executor.shutdown(wait=True)
+
+        self._reader.close()
+        self._writer.close()
+
+        self._reader = self._writer = None
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False
+        )
+        connection.execute(f'PRAGMA busy_timeout={self.busy_timeout:d}')
+        connection.execute(f'PRAGMA mmap_size={self.mmap_size:d}')
+        connection.execute('PRAGMA synchronous=NORMAL')
+
+        return connection
+
+    def _loads(self, value: t.Any) -> t.Any:
+        if self.serializer is None:
+            return value
+
+        return self.serializer.loads(value)
+
+    def _dumps(self, value: t.Any) -> t.Any:
+        if self.serializer is None:
+            return value
+
+        return self.serializer.dumps(value)
+
+    async def _write(self, func: t.Callable, *args: t.Any) -> t.Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, func, *args
+        )
+
+    def _multi_set(self, items: list[ItemType], nx: bool) -> list[bool]:
+        now = self._timer()
+        query = self.SET_NX_QUERY if nx else self.SET_QUERY
+
+        written = []
+        with self._transaction():
+            for key, value, ttl in items:
+                expires_at = None if ttl is None else now + ttl
+                params = (key, self._dumps(value), expires_at)
+
+                cursor = self._writer.execute(
+                    query, (*params, now) if nx else params
+                )
+                written.append(cursor.rowcount == 1)
+
+            if now >= self._next_purge:
+                self._purge(now)
+
+        return written
+
+    def _multi_delete(self, keys: t.Sequence[t.Any]) -> int:
+        now = self._timer()
+        deleted = 0
+
+        with self._transaction():
+            for i in range(0, len(keys), self.CHUNK_SIZE):
+                chunk = keys[i:i+self.CHUNK_SIZE]
+                deleted += self._writer.execute(
+                    'DELETE FROM storage '
+                    f'WHERE key IN ({", ".join("?" * len(chunk))}) '
+                    'AND (expires_at IS NULL OR expires_at > ?)',
+                    (*chunk, now)
+                ).rowcount
+
+        return deleted
+
+    def _update_shared(
+            self,
+            key: t.Any,
+            value: t.Any,
+            ref: str,
+            ttl: t.Optional[int | float]
+    ) -> bool:
+        now = self._timer()
+        refs_key = _refs_key(key)
+
+        # refs are read and written within one write transaction
+        with self._transaction():
+            row = self._writer.execute(
+                'SELECT value FROM storage WHERE key = ? '
+                'AND (expires_at IS NULL OR expires_at > ?)',
+                (refs_key, now)
+            ).fetchone()
+            refs = _live_refs(
+                None if row is None else self._loads(row[0]), now
+            )
+
+            if value is _MISSING:
+                refs.pop(ref, None)
+            else:
+                refs[ref] = None if ttl is None else now + ttl
+
+            if not refs:
+                self._writer.execute(
+                    'DELETE FROM storage WHERE key IN (?, ?)', (key, refs_key)
+                )
+
+                return False
+
+            expires_at = _refs_expires_at(refs)
+            self._writer.execute(
+                self.SET_QUERY, (refs_key, self._dumps(refs), expires_at)
+            )
+            if value is _MISSING:
+                self._writer.execute(
+                    'UPDATE storage SET expires_at = ? WHERE key = ?',
+                    (expires_at, key)
+                )
+            else:
+                self._writer.execute(
+                    self.SET_QUERY, (key, self._dumps(value), expires_at)
+                )
+
+        return True
+
+    def _purge(self, now: float):
+        purged = self._writer.execute(
+            'DELETE FROM storage WHERE expires_at <= ?', (now,)
+        ).rowcount
+        self._next_purge = now + self.purge_interval
+
+        log.debug('sqlite storage purged, %d expired keys removed', purged)
+
+    @contextlib.contextmanager
+    def _transaction(self) -> t.Iterator[None]:
+        self._writer.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._writer.execute('ROLLBACK')
+
+            raise
+
+        self._writer.execute('COMMIT')
+
+
+class _MemoryEntry:
+
+    __slots__ = ('value', 'expires_at', 'size')
+
+    def __init__(self, value: t.Any, expires_at: t.Optional[float], size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+
+class Memory(BaseStorage):
+
+    # rough per key cost of dict slot, entry object and heap item
+    ENTRY_OVERHEAD = 200
+
+    def __init__(
+            self,
+            max_bytes: int = 64 * 1024 * 1024,
+            snapshot_path: t.Optional[str] = None,
+            _timer: t.Callable[[], float] = time.time
+    ):
+        self.max_bytes = max_bytes
+        self.snapshot_path = snapshot_path
+
+        self._timer = _timer
+        self._entries: OrderedDict[t.Any, _MemoryEntry] = OrderedDict()
+        self._expirations: list[tuple[float, t.Any]] = []
+        self._bytes = 0
+        self._evictions = 0
+        self._expired = 0
+
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            self.load(self.snapshot_path)
+
+    async def get(self, key: t.Any) -> t.Any:
+        entry = self._get_entry(key, self._timer())
+
+        return None if entry is None else entry.value
+
+    async def multi_get(self, *keys: t.Any) -> t.Iterable[t.Any]:
+        return [await self.get(k) for k in keys]
+
+    async def multi_get_ttl(self, *keys: t.Any) -> list[tuple[t.Any, int]]:
+        now = self._timer()
+        items = []
+
+        for key in keys:
+            entry = self._get_entry(key, now)
+            if entry is None:
+                items.append((None, -2))
+            elif entry.expires_at is None:
+                items.append((entry.value, -1))
+            else:
+                items.append((entry.value, math.ceil(entry.expires_at - now)))  # noqa
+
+        return items
+
+    async def ttl(self, key: t.Any) -> int:
+        return (await self.multi_get_ttl(key))[0][1]
+
+    async def multi_ttl(self, *keys: t.Any) -> list[int]:
+        return [ttl for _, ttl in await self.multi_get_ttl(*keys)]
+
+    async def set(
+            self,
+            key: t.Any,
+            value: t.Any,
+            ttl: t.Optional[int | float] = None,
+            nx: bool = False
+    ) -> bool:
+        now = self._timer()
+
+        self._sweep(now)
+
+        if nx and self._get_entry(key, now) is not None:
+            return False
+
+        self._discard(key)
+        self._add(key, value, None if ttl is None else now + ttl)
+
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._discard(next(iter(self._entries)))
+            self._evictions += 1
+
+        return True
+
+    async def multi_set(
+            self,
+            items: t.Iterable[ItemType],
+            nx: bool = False
+    ) -> list[bool]:
+        return [await self.set(*item, nx=nx) for item in items]
+
+    async def multi_delete(self, *keys: t.Any) -> int:
+        now = self._timer()
+
+        return sum(
+            self._discard(k) for k in keys if self._get_entry(k, now) is not None  # noqa
+        )
+
+    async def set_shared(
+            self,
+            key: t.Any,
+            value: t.Any,
+            ref: str,
+            ttl: t.Optional[int | float] = None
+    ) -> bool:
+        return await _update_shared(self, key, value, ref, ttl, self._timer())
+
+    async def release_shared(self, key: t.Any, ref: str) -> bool:
+        return not await _update_shared(
+            self, key, _MISSING, ref, None, self._timer()
+        )
+
+    async def ping(self) -> bool:
+        return True
+
+    async def close(self):
+        if self.snapshot_path:
+            self.save(self.snapshot_path)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            'size': len(self._entries),
+            'bytes': self._bytes,
+            'evictions': self._evictions,
+            'expired': self._expired,
+        }
+
+    def save(self, path: str):
+        now = self._timer()
+        tmp_path = f'{path}.tmp'
+
+        with open(tmp_path, 'w') as f:
+            for key, entry in self._entries.items():
+                if entry.expires_at is not None and entry.expires_at <= now:
+                    continue
+
+                f.write(ujson.dumps([key, entry.value, entry.expires_at]))
+                f.write('\n')
+
+        # snapshot is replaced atomically, so crash never leaves it broken
+        os.replace(tmp_path, path)
+
+        log.debug('memory storage saved, %d keys', len(self._entries))
+
+    def load(self, path: str):
+        now = self._timer()
+
+        with open(path) as f:
+            for line in f:
+                key, value, expires_at = ujson.loads(line)
+                if expires_at is not None and expires_at <= now:
+                    continue
+
+                self._add(key, value, expires_at)
+
+        log.debug('memory storage loaded, %d keys', len(self._entries))
+
+    def _add(self, key: t.Any, value: t.Any, expires_at: t.Optional[float]):
+        size = self.ENTRY_OVERHEAD + _estimate_size(key) + _estimate_size(value)  # noqa
+
+        self._entries[key] = _MemoryEntry(value, expires_at, size)
+        self._bytes += size
+
+        if expires_at is not None:
+            heapq.heappush(self._expirations, (expires_at, key))
+
+    def _get_entry(self, key: t.Any, now: float) -> t.Optional[_MemoryEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if entry.expires_at is not None and entry.expires_at <= now:
+            self._discard(key)
+            self._expired += 1
+
+            return None
+
+        self._entries.move_to_end(key)
+
+        return entry
+
+    def _discard(self, key: t.Any) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+
+        # heap item is left behind and skipped by sweep
+        self._bytes -= entry.size
+
+        return True
+
+    def _sweep(self, now: float):
+        expirations = self._expirations
+
+        while expirations and expirations[0][0] <= now:
+            expires_at, key = heapq.heappop(expirations)
+
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at == expires_at:
+                self._discard(key)
+                self._expired += 1
+
+        # rewritten and deleted keys leave stale heap items behind
+        if len(expirations) > 2 * len(self._entries) + 1024:
+            self._expirations = [
+                (entry.expires_at, key)
+                for key, entry in self._entries.items()
+                if entry.expires_at is not None
+            ]
+            heapq.heapify(self._expirations)
+
+
+class Fake(BaseStorage):
+
+    def __init__(self):
+        self._storage = {}
+
+    async def get(self, key: t.Any) -> t.Any:
+        return self._storage.get(key)
+
+    async def multi_get(self, *keys: t.Any) -> t.Iterable[t.Any]:
+        return [self._storage.get(k) for k in keys]
+
+    async def multi_get_ttl(self, *keys: t.Any) -> list[tuple[t.Any, int]]:
+        return list(zip(await self.multi_get(*keys), await self.multi_ttl(*keys)))  # noqa
+
+    async def ttl(self, key: t.Any) -> int:
+        return -1 if key in self._storage else -2
+
+    async def multi_ttl(self, *keys: t.Any) -> list[int]:
+        return [await self.ttl(k) for k in keys]
+
+    async def set(
+            self,
+            key: t.Any,
+            value: t.Any,
+            ttl: t.Optional[int | float] = None,
+            nx: bool = False
+    ) -> bool:
+        if nx and key in self._storage:
+            return False
+
+        self._storage[key] = value
+
+        return True
+
+    async def multi_set(
+            self,
+            items: t.Iterable[ItemType],
+            nx: bool = False
+    ) -> list[bool]:
+        return [await self.set(key, value, nx=nx) for key, value, _ in items]
+
+    async def multi_delete(self, *keys: t.Any) -> int:
+        deleted = 0
+
+        for k in keys:
+            try:
+                del self._storage[k]
+            except KeyError:
+                continue
+            else:
+                deleted += 1
+
+        return deleted
+
+    async def set_shared(
+            self,
+            key: t.Any,
+            value: t.Any,
+            ref: str,
+            ttl: t.Optional[int | float] = None
+    ) -> bool:
+        return await _update_shared(self, key, value, ref, ttl, time.time())
+
+    async def release_shared(self, key: t.Any, ref: str) -> bool:
+        return not await _update_shared(
+            self, key, _MISSING, ref, None, time.time()
+        )
+
+    async def ping(self) -> bool:
+        return True
+
+    async def close(self):
+        pass
+
+
+class Cached(BaseStorage):
+
+    def __init__(
+            self,
+            storage: BaseStorage,
+            size: int = 1024,
+            max_ttl: int | float = 10,
+            negative_ttl: int | float = 0,
+            bus: t.Optional[BaseInvalidationBus] = None,
+            _timer: t.Callable[[], float] = time.monotonic
+    ):
+        self.storage = storage
+        self.size = size
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.bus = bus
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._timer = _timer
+        self._cache: OrderedDict[t.Any, _CacheEntry] = OrderedDict()
+        self._local = True
+
+    async def get(self, key: t.Any) -> t.Any:
+        return (await self.multi_get_ttl(key))[0][0]
+
+    async def multi_get(self, *keys: t.Any) -> t.Iterable[t.Any]:
+        return [value for value, _ in await self.multi_get_ttl(*keys)]
+
+    async def multi_get_ttl(self, *keys: t.Any) -> list[tuple[t.Any, int]]:
+        values = [self._get_local(k) for k in keys]
+
+        missed = [k for k, v in zip(keys, values) if v is _MISSING]
+        if not missed:
+            return values
+
+        fetched = dict(zip(missed, await self.storage.multi_get_ttl(*missed)))
+        for key, (value, ttl) in fetched.items():
+            self._set_local(key, value, ttl)
+
+        return [fetched[k] if v is _MISSING else v for k, v in zip(keys, values)]  # noqa
+
+    async def ttl(self, key: t.Any) -> int:
+        value = self._get_local(key)
+        if value is not _MISSING:
+            return value[1]
+
+        return await self.storage.ttl(key)
+
+    async def multi_ttl(self, *keys: t.Any) -> list[int]:
+        return await self.storage.multi_ttl(*keys)
+
+    async def set(
+            self,
+            key: t.Any,
+            value: t.Any,
+            ttl: t.Optional[int | float] = None,
+            nx: bool = False
+    ) -> bool:
+        self.invalidate(key)
+
+        written = await self.storage.set(key, value, ttl=ttl, nx=nx)
+
+        if written:
+            self._set_local(key, value, -1 if ttl is None else ttl)
+
+            await self._publish(key)
+
+        return written
+
+    async def multi_set(
+            self,
+            items: t.Iterable[ItemType],
+            nx: bool = False
+    ) -> list[bool]:
+        items = list(items)
+        keys = [key for key, _, _ in items]
+
+        self.invalidate(*keys)
+
+        written = await self.storage.multi_set(items, nx=nx)
+
+        for (key, value, ttl), w in zip(items, written):
+            if w:
+                self._set_local(key, value, -1 if ttl is None else ttl)
+
+        await self._publish(*(k for k, w in zip(keys, written) if w))
+
+        return written
+
+    async def multi_delete(self, *keys: t.Any) -> int:
+        self.invalidate(*keys)
+
+        deleted = await self.storage.multi_delete(*keys)
+
+        await self._publish(*keys)
+
+        return deleted
+
+    async def set_shared(
+            self,
+            key: t.Any,
+            value: t.Any,
+            ref: str,
+            ttl: t.Optional[int | float] = None
+    ) -> bool:
+        self.invalidate(key)
+
+        written = await self.storage.set_shared(key, value, ref, ttl=ttl)
+
+        await self._publish(key)
+
+        return written
+
+    async def release_shared(self, key: t.Any, ref: str) -> bool:
+        self.invalidate(key)
+
+        released = await self.storage.release_shared(key, ref)
+
+        await self._publish(key)
+
+        return released
+
+    async def ping(self) -> bool:
+        return await self.storage.ping()
+
+    async def close(self):
+        self._cache.clear()
+
+        if self.bus is not None:
+            await self.bus.close()
+
+        await self.storage.close()
+
+    async def listen(self, retry_timeout: int | float = 1):
+        if self.bus is None:
+            return
+
+        while True:
+            try:
+                await self.bus.listen(self.invalidate)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(
+                    'invalidation bus error: %s', str(e) or 'empty error message'  # noqa
+                )
+
+            # messages could be lost while unsubscribed
+            self._cache.clear()
+
+            await asyncio.sleep(retry_timeout)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._cache),
+        }
+
+    async def _publish(self, *keys: t.Any):
+        if self.bus is None or not keys:
+            return
+
+        # storage is written already, failed publish mustn't fail the write
+        try:
+            await self.bus.publish(*keys)
+        except Exception as e:
+            log.warning(
+                'invalidation publish error: %s', str(e) or 'empty error message'  # noqa
+            )
+
+            self.invalidate(*keys)
+
+    def uncached(self) -> 'Cached':
+        # shares local entries, so its writes still invalidate them
+        storage = copy.copy(self)
+        storage._local = False
+
+        return storage
+
+    def invalidate(self, *keys: t.Any):
+        for k in keys:
+            self._cache.pop(k, None)
+
+    def _get_local(self, key: t.Any) -> t.Any:
+        if not self._local:
+            return _MISSING
+
+        try:
+            value, expires_at, deadline = self._cache[key]
+        except KeyError:
+            self.misses += 1
+
+            return _MISSING
+
+        now = self._timer()
+        if expires_at <= now:
+            del self._cache[key]
+            self.misses += 1
+
+            return _MISSING
+
+        self._cache.move_to_end(key)
+        self.hits += 1
+
+        # negative entry of a missing key
+        if value is None:
+            return None, -2
+
+        return value, -1 if deadline is None else int(deadline - now)
+
+    def _set_local(self, key: t.Any, value: t.Any, ttl: int):
+        if self.size <= 0 or not self._local:
+            return
+
+        now = self._timer()
+
+        # redis marks persistent keys with -1 and missing ones with -2
+        if value is None or ttl == -2:
+            if self.negative_ttl <= 0:
+                return
+
+            entry = (None, now + self.negative_ttl, None)
+        elif ttl == 0:
+            return
+        elif ttl == -1:
+            entry = (value, now + self.max_ttl, None)
+        else:
+            entry = (value, now + min(ttl, self.max_ttl), now + ttl)
+
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+
+        while len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+            self.evictions += 1
+
+
+def uncached(storage: BaseStorage) -> BaseStorage:
+    # bulk operations bypass local cache, so they don't flush its hot keys
+    if isinstance(storage, Cached):
+        return storage.uncached()
+
+    return storage
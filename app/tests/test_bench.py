@@ -0,0 +1,32 @@
+import pytest
+
+from bench import percentile, zipf_weights, parse_mix
+
+
+@pytest.mark.parametrize(
+        "q, expected",
+        [
+            (0, 1),
+            (50, 51),
+            (99, 99),
+            (100, 100),
+        ]
+)
+def test_percentile__samples__nearest_rank(q, expected):
+    samples = list(range(100, 0, -1))
+
+    assert percentile(samples, q) == expected
+
+
+def test_percentile__empty_samples__zero():
+    assert percentile([], 99) == 0.0
+
+
+def test_zipf_weights__size__cumulative_decreasing_steps():
+    weights = zipf_weights(3, 1)
+
+    assert weights == [1, 1.5, 1.5 + 1 / 3]
+
+
+def test_parse_mix__string__weights():
+    assert parse_mix('redirect:80, delete:2') == {'redirect': 80, 'delete': 2}
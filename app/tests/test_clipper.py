@@ -1,8 +1,58 @@
+import asyncio
+
+import aiohttp
 import pytest
 
-from unittest.mock import patch, AsyncMock
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from unittest.mock import patch, AsyncMock, MagicMock
+
+import metrics
+
+from clipper import Client, CircuitBreaker, BreakerState
+from exceptions import ClipperUnavailable, ClipRejected
+
+
+@pytest.fixture
+async def clipper_server():
+    # stand-in for clipper service, failed urls are those containing "fail"
+    requests = []
+
+    def clip_url(url):
+        return None if 'fail' in url else {'title': url}
+
+    async def clip(request):
+        data = await request.json()
+        requests.append([data['url']])
+
+        return web.json_response(clip_url(data['url']) or {})
+
+    async def clip_batch(request):
+        data = await request.json()
+        requests.append(data['urls'])
+
+        return web.json_response([clip_url(url) for url in data['urls']])
+
+    app = web.Application()
+    app.router.add_post('/clipper', clip)
+    app.router.add_post('/clipper/batch', clip_batch)
+
+    server = TestServer(app)
+    await server.start_server()
+    server.requests = requests
+
+    yield server
+
+    await server.close()
+
+
+@pytest.fixture
+def mocked_session():
+    session = AsyncMock(name='mocked_session')
 
-from clipper import Client
+    with patch('clipper.aiohttp.ClientSession', return_value=session), \
+            patch('clipper.aiohttp.TCPConnector'):
+        yield session
 
 
 @pytest.mark.parametrize(
@@ -54,3 +104,303 @@ async def test_client_close__session__close():
         await client.close()
 
         assert mocked_session.close.called
+
+
+@pytest.mark.asyncio
+async def test_client_clip__session_errors__failure_raised(mocked_session):
+    mocked_session.post.side_effect = aiohttp.ClientConnectionError()
+
+    client = Client(
+        url='http://url.com/clipper', token='tokem', backoff_base=0
+    )
+    failures = metrics.CLIPPER_FAILURES.labels().value
+    retries = metrics.CLIPPER_RETRIES.labels().value
+
+    with pytest.raises(ClipperUnavailable):
+        await client.clip('url')
+
+    assert mocked_session.post.call_count == 3
+    assert metrics.CLIPPER_FAILURES.labels().value == failures + 1
+    assert metrics.CLIPPER_RETRIES.labels().value == retries + 2
+
+
+@pytest.mark.asyncio
+async def test_client_clip__rejected_url__not_retried(mocked_session):
+    mocked_session.post.side_effect = aiohttp.ClientResponseError(
+        MagicMock(), (), status=422
+    )
+
+    client = Client(
+        url='http://url.com/clipper', token='tokem', breaker_threshold=1
+    )
+
+    with pytest.raises(ClipRejected):
+        await client.clip('url')
+
+    assert mocked_session.post.call_count == 1
+    assert client.state is BreakerState.CLOSED
+
+
+@pytest.mark.parametrize("status", [408, 429, 503])
+@pytest.mark.asyncio
+async def test_client_clip__service_status__retried_failure(
+        mocked_session,
+        status
+):
+    mocked_session.post.side_effect = aiohttp.ClientResponseError(
+        MagicMock(), (), status=status
+    )
+
+    client = Client(
+        url='http://url.com/clipper',
+        token='tokem',
+        backoff_base=0,
+        breaker_threshold=3
+    )
+
+    with pytest.raises(ClipperUnavailable):
+        await client.clip('url')
+
+    assert mocked_session.post.call_count == 3
+    assert client.state is BreakerState.OPEN
+
+
+def test_client_backoff__retry_after__respected_within_limit(mocked_session):
+    client = Client(url='http://url.com/clipper', token='tokem', backoff_max=5)
+
+    def throttled(retry_after):
+        return aiohttp.ClientResponseError(
+            MagicMock(), (), status=429, headers={'Retry-After': retry_after}
+        )
+
+    assert client._backoff(1, throttled('2')) == 2
+    assert client._backoff(1, throttled('7')) == 5
+    assert client._backoff(1, throttled('soon')) <= client.backoff_base
+
+
+@pytest.mark.asyncio
+async def test_client_clip__breaker_open__fails_fast(mocked_session, clip):
+    now = 0
+    mocked_session.post.side_effect = aiohttp.ClientConnectionError()
+
+    client = Client(
+        url='http://url.com/clipper',
+        token='tokem',
+        retries=2,
+        backoff_base=0,
+        breaker_threshold=3,
+        breaker_reset_timeout=30,
+        _timer=lambda: now
+    )
+
+    for _ in range(2):
+        with pytest.raises(ClipperUnavailable):
+            await client.clip('url')
+
+    assert client.state is BreakerState.OPEN
+    assert mocked_session.post.call_count == 3
+
+    with pytest.raises(ClipperUnavailable):
+        await client.clip('other')
+
+    assert mocked_session.post.call_count == 3
+
+    now = 30
+    mocked_session.post.side_effect = None
+    mocked_session.post.return_value.json.return_value = clip
+
+    assert await client.clip('url') == clip
+    assert client.state is BreakerState.CLOSED
+
+
+def test_client_backoff__retries__exponential_with_cap():
+    client = Client(url='', token='', backoff_base=1, backoff_max=5)
+
+    with patch('clipper.random.uniform', side_effect=lambda a, b: b):
+        delays = [client._backoff(retry) for retry in range(1, 6)]
+
+    assert delays == [1, 2, 4, 5, 5]
+
+
+def test_circuit_breaker__half_open__single_probe():
+    now = 0
+    breaker = CircuitBreaker(threshold=2, reset_timeout=10, _timer=lambda: now)
+
+    breaker.record_failure()
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state is BreakerState.OPEN
+    assert not breaker.allow()
+
+    now = 10
+    assert breaker.state is BreakerState.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state is BreakerState.OPEN
+
+    now = 20
+    assert breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state is BreakerState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_client_clip__concurrent_same_url__single_request(clip):
+    mocked_session = AsyncMock(name='mocked_session')
+    mocked_session.post.return_value.json.return_value = clip
+
+    with patch('clipper.aiohttp') as mocked_aiohttp:
+        mocked_aiohttp.ClientSession.return_value = mocked_session
+
+        client = Client(url='http://url.com/clipper', token='tokem')
+        result = await asyncio.gather(
+            client.clip('url'), client.clip('url'), client.clip('other')
+        )
+
+        assert result == [clip, clip, clip]
+        assert mocked_session.post.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_client_clip__cached_url__reused_until_expired(clip):
+    now = 0
+    mocked_session = AsyncMock(name='mocked_session')
+    mocked_session.post.return_value.json.return_value = clip
+
+    with patch('clipper.aiohttp') as mocked_aiohttp:
+        mocked_aiohttp.ClientSession.return_value = mocked_session
+
+        client = Client(
+            url='http://url.com/clipper',
+            token='tokem',
+            cache_ttl=60,
+            _timer=lambda: now
+        )
+        await client.clip('url')
+        await client.clip('url')
+        now = 60
+        await client.clip('url')
+
+        assert mocked_session.post.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_client_clip__failed__not_cached(mocked_session, clip):
+    mocked_session.post.side_effect = [aiohttp.ClientConnectionError()] * 3 + [AsyncMock()]  # noqa
+
+    client = Client(
+        url='http://url.com/clipper', token='tokem', backoff_base=0
+    )
+
+    with pytest.raises(ClipperUnavailable):
+        await client.clip('url')
+    await client.clip('url')
+
+    assert mocked_session.post.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_client_clip__batch_mode__single_batched_request(clipper_server):
+    client = Client(
+        url=str(clipper_server.make_url('/clipper')),
+        token='tokem',
+        batch_size=10,
+        batch_delay=0.01
+    )
+
+    try:
+        result = await asyncio.gather(
+            client.clip('a'), client.clip('b'), client.clip('a')
+        )
+    finally:
+        await client.close()
+
+    assert result == [{'title': 'a'}, {'title': 'b'}, {'title': 'a'}]
+    assert clipper_server.requests == [['a', 'b']]
+
+
+@pytest.mark.asyncio
+async def test_client_clip__batch_size_reached__flushed(clipper_server):
+    client = Client(
+        url=str(clipper_server.make_url('/clipper')),
+        token='tokem',
+        batch_size=2,
+        batch_delay=10
+    )
+
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*(client.clip(url) for url in 'abcd')), 1
+        )
+    finally:
+        await client.close()
+
+    assert clipper_server.requests == [['a', 'b'], ['c', 'd']]
+
+
+@pytest.mark.asyncio
+async def test_client_close__pending_batch__fetched_before_close(
+        clipper_server
+):
+    client = Client(
+        url=str(clipper_server.make_url('/clipper')),
+        token='tokem',
+        batch_size=10,
+        batch_delay=10
+    )
+
+    task = asyncio.create_task(client.clip('a'))
+    await asyncio.sleep(0.01)
+    await client.close()
+
+    assert await asyncio.wait_for(task, 1) == {'title': 'a'}
+    assert client._batcher._handle is None
+    assert not client._batcher._tasks
+
+
+@pytest.mark.asyncio
+async def test_client_clip__batch_item_rejected__only_its_caller_fails(
+        clipper_server
+):
+    client = Client(
+        url=str(clipper_server.make_url('/clipper')),
+        token='tokem',
+        batch_size=10
+    )
+
+    try:
+        ok, failed = await asyncio.gather(
+            client.clip('ok'), client.clip('fail'), return_exceptions=True
+        )
+    finally:
+        await client.close()
+
+    assert ok == {'title': 'ok'}
+    assert isinstance(failed, ClipRejected)
+    assert client.state is BreakerState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_client_clip__batch_request_failed__all_callers_fail(
+        mocked_session
+):
+    mocked_session.post.side_effect = aiohttp.ClientConnectionError()
+
+    client = Client(
+        url='http://url.com/clipper',
+        token='tokem',
+        retries=1,
+        batch_size=10
+    )
+
+    results = await asyncio.gather(
+        client.clip('a'), client.clip('b'), return_exceptions=True
+    )
+
+    assert all(isinstance(r, ClipperUnavailable) for r in results)
+    assert mocked_session.post.call_count == 1
+    assert mocked_session.post.call_args.args[0] == '/clipper/batch'
@@ -1,12 +1,23 @@
+import asyncio
+
 import pytest
 
 import handlers
 import constants as const
 import utils
 
-from unittest.mock import patch
-
-from exceptions import InvalidParameters
+from unittest.mock import AsyncMock
+
+from jobs import JobState
+from storage import Memory
+from exceptions import (
+    InvalidParameters,
+    StillProcessing,
+    ClipQueueFull,
+    UIDAlreadyExists,
+    ClipperUnavailable,
+    ClipRejected,
+)
 
 
 @pytest.mark.asyncio
@@ -21,19 +32,84 @@ async def test_redirect__mocked_storage_value(mocked_storage, url, uid):
 
 @pytest.mark.asyncio
 async def test_clip__mocked_storage__value(mocked_storage, url, uid):
-    mget_return = (url, {'test_key', 'test_value'})
+    data = {'test_key': 'test_value'}
     ttl_return = 1000
-    expected = (*mget_return, utils.seconds_to_str_time(ttl_return))
+    expected = (url, data, utils.seconds_to_str_time(ttl_return))
+
+    mocked_storage.multi_get_ttl.return_value = [(url, ttl_return), (data, ttl_return)]  # noqa
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+    mocked_jobs.in_progress.return_value = False
+
+    result = await handlers.clip(uid, mocked_storage, mocked_jobs)
+
+    assert result == expected
+    mocked_storage.multi_get_ttl.assert_called_with(utils.url_storage_key(uid), utils.clip_storage_key(uid))  # noqa
+    mocked_storage.ttl.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_clip__clip_reference__resolved(mocked_storage, url, uid, clip):
+    content_key = utils.clip_content_key(url)
+
+    mocked_storage.multi_get_ttl.return_value = [(url, -1), (content_key, -1)]  # noqa
+    mocked_storage.get.return_value = clip
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+    mocked_jobs.in_progress.return_value = False
+
+    _, data, _ = await handlers.clip(uid, mocked_storage, mocked_jobs)
+
+    assert data == clip
+    mocked_storage.get.assert_called_with(content_key)
+
+
+@pytest.mark.asyncio
+async def test_clip__lost_clip__resubmitted(mocked_storage, url, uid, ttl):
+    mocked_storage.multi_get_ttl.return_value = [(url, ttl), ('content', ttl)]
+    mocked_storage.get.return_value = None
+    mocked_storage.set.return_value = True
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+    mocked_jobs.in_progress.return_value = False
+    mocked_jobs.state.return_value = None
+
+    _, data, _ = await handlers.clip(uid, mocked_storage, mocked_jobs)
 
-    mocked_storage.multi_get.return_value = mget_return
-    mocked_storage.ttl.return_value = ttl_return
+    assert data is None
+    mocked_jobs.submit.assert_called_with(uid, url, ttl)
 
-    with patch('handlers.clip_task_name') as mocked_clip_task_name:
-        result = await handlers.clip(uid, mocked_storage)
 
-        assert result == expected
-        mocked_clip_task_name.assert_called()
-        mocked_storage.multi_get.assert_called_with(utils.url_storage_key(uid), utils.clip_storage_key(uid))  # noqa
+@pytest.mark.asyncio
+async def test_clip__failed_job__resubmitted_once_per_interval(url, uid):
+    now = 0
+    storage = Memory(_timer=lambda: now)
+    await storage.set(utils.url_storage_key(uid), url)
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+    mocked_jobs.in_progress.return_value = False
+    mocked_jobs.state.return_value = JobState.FAILED
+
+    for _ in range(3):
+        _, data, _ = await handlers.clip(
+            uid, storage, mocked_jobs, retry_interval=60
+        )
+
+        assert data is None
+
+    now = 60
+    await handlers.clip(uid, storage, mocked_jobs, retry_interval=60)
+
+    assert mocked_jobs.submit.call_count == 2
+    mocked_jobs.submit.assert_called_with(uid, url, None)
+
+
+@pytest.mark.asyncio
+async def test_clip__job_in_progress__exception(mocked_storage, uid):
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+    mocked_jobs.in_progress.return_value = True
+
+    with pytest.raises(StillProcessing):
+        await handlers.clip(uid, mocked_storage, mocked_jobs)
+
+    mocked_jobs.in_progress.assert_called_with(uid)
+    mocked_storage.multi_get.assert_not_called()
 
 
 @pytest.mark.parametrize(
@@ -68,6 +144,8 @@ def test_shortify_input__default_uid_len__uid():
             {'url': 'test_url', 'clip': 'False'},
             {'url': 'test_url', 'uid': 'health'},  # from const.KEY_WORDS
             {'url': 'test_url', 'uid': 'static'},  # from const.KEY_WORDS
+            {'url': 42},
+            {'url': 'test_url', 'uid': 42},
         ]
 )
 def test_shortify_input__invalid_inputes__exception(test_input):
@@ -85,36 +163,289 @@ async def test_clipper_task__moked_storage_clipper__clipped_storaged(
         clip
 ):
     mocked_clipper.clip.return_value = clip
+    content_key = utils.clip_content_key(url)
+    clip_key = utils.clip_storage_key(uid)
 
-    await handlers._clipper_task(uid, url, ttl, mocked_storage, mocked_clipper)
+    await handlers.clipper_task(uid, url, ttl, mocked_storage, mocked_clipper)
 
     mocked_clipper.clip.assert_called_with(url)
-    mocked_storage.set.assert_called_with(utils.clip_storage_key(uid), clip, ttl=ttl)  # noqa
+    mocked_storage.set_shared.assert_called_with(content_key, clip, clip_key, ttl=ttl)  # noqa
+    ref = utils.clip_reference(content_key, utils.clip_digest(clip))
+    mocked_storage.set.assert_called_with(clip_key, ref, ttl=ttl)
 
 
 @pytest.mark.asyncio
-async def test_shortify__without_clip__uid(
+async def test_clipper_task__concurrent_clips__longest_ttl_kept(
+        mocked_clipper,
+        url,
+        clip
+):
+    now = 0
+    storage = Memory(_timer=lambda: now)
+    mocked_clipper.clip.return_value = clip
+
+    await asyncio.gather(
+        handlers.clipper_task('long', url, 12 * 3600, storage, mocked_clipper),  # noqa
+        handlers.clipper_task('short', url, 3600, storage, mocked_clipper),
+    )
+
+    assert await storage.ttl(utils.clip_content_key(url)) == 12 * 3600
+
+    now = 2 * 3600
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+    mocked_jobs.in_progress.return_value = False
+    await storage.set(utils.url_storage_key('long'), url)
+
+    _, data, _ = await handlers.clip('long', storage, mocked_jobs)
+
+    assert data == clip
+
+
+@pytest.mark.asyncio
+async def test_clipper_task__new_clip__new_version(mocked_clipper, url, uid):
+    storage = Memory()
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+    mocked_jobs.in_progress.return_value = False
+    await storage.set(utils.url_storage_key(uid), url)
+
+    versions = []
+    for content in ('first', 'second', 'second'):
+        mocked_clipper.clip.return_value = {'content': content}
+        await handlers.clipper_task(uid, url, None, storage, mocked_clipper)
+
+        _, ref, _ = await handlers.clip_head(uid, storage, mocked_jobs)
+        versions.append(handlers.clip_version(ref))
+
+    assert versions[0] != versions[1] == versions[2]
+    assert handlers.clip_version(utils.clip_content_key(url)) is None
+
+
+@pytest.mark.asyncio
+async def test_delete__last_reference__shared_clip_removed(
+        mocked_clipper,
+        url,
+        clip
+):
+    storage = Memory()
+    mocked_clipper.clip.return_value = clip
+
+    await handlers.clipper_task('first', url, None, storage, mocked_clipper)
+    await handlers.clipper_task('second', url, 60, storage, mocked_clipper)
+
+    await handlers.delete('first', storage)
+    assert await storage.ttl(utils.clip_content_key(url)) == 60
+
+    await handlers.delete('second', storage)
+    assert await storage.get(utils.clip_content_key(url)) is None
+
+
+@pytest.mark.asyncio
+async def test_clipper_task__clip_rejected__empty_clip_stored(
         mocked_storage,
         mocked_clipper,
         url,
         uid,
+        ttl
+):
+    mocked_clipper.clip.side_effect = ClipRejected()
+
+    await handlers.clipper_task(uid, url, ttl, mocked_storage, mocked_clipper)
+
+    mocked_storage.set_shared.assert_called_with(
+        utils.clip_content_key(url), {}, utils.clip_storage_key(uid), ttl=ttl
+    )
+
+
+@pytest.mark.asyncio
+async def test_clipper_task__clipper_unavailable__not_stored(
+        mocked_storage,
+        mocked_clipper,
+        url,
+        uid,
+        ttl
+):
+    mocked_clipper.clip.side_effect = ClipperUnavailable()
+
+    with pytest.raises(ClipperUnavailable):
+        await handlers.clipper_task(uid, url, ttl, mocked_storage, mocked_clipper)  # noqa
+
+    mocked_storage.multi_set.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_shortify__without_clip__uid(
+        mocked_storage,
+        url,
+        uid,
         ttl_str,
         ttl
 ):
     test_args = {'url': url, 'clip': 'false', 'uid': uid, 'ttl': ttl_str}
 
-    result = await handlers.shortify(test_args, mocked_storage, mocked_clipper)
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+
+    result = await handlers.shortify(test_args, mocked_storage, mocked_jobs)
 
     assert result
-    mocked_storage.set.assert_called_with(utils.url_storage_key(uid), url, ttl=ttl)  # noqa
-    mocked_clipper.clip.assert_not_called()
+    mocked_storage.set.assert_called_with(utils.url_storage_key(uid), url, ttl=ttl, nx=True)  # noqa
+    mocked_jobs.submit.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_shortify__with_clip__job_submitted(
+        mocked_storage,
+        url,
+        uid,
+        ttl_str,
+        ttl
+):
+    test_args = {'url': url, 'clip': 'true', 'uid': uid, 'ttl': ttl_str}
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+
+    await handlers.shortify(test_args, mocked_storage, mocked_jobs)
+
+    mocked_jobs.submit.assert_called_with(uid, url, ttl)
 
 
 @pytest.mark.asyncio
 async def test_delete__mocked_storage__bool(mocked_storage, uid):
     mocked_storage.multi_delete.return_value = 2
+    mocked_storage.get.return_value = None
 
     result = await handlers.delete(uid, mocked_storage)
 
     assert result
     mocked_storage.multi_delete.assert_called_with(utils.url_storage_key(uid), utils.clip_storage_key(uid))  # noqa
+    mocked_storage.release_shared.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_shortify__clip_queue_full__not_stored(mocked_storage, url):
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+    mocked_jobs.ensure_capacity.side_effect = ClipQueueFull()
+
+    with pytest.raises(ClipQueueFull):
+        await handlers.shortify({'url': url}, mocked_storage, mocked_jobs)
+
+    mocked_storage.set.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_multi_shortify__mixed_entries__per_item_results(
+        mocked_storage,
+        url,
+        uid,
+        ttl
+):
+    entries = [
+        {'url': url, 'uid': uid, 'ttl': '1s', 'clip': False},
+        {'url': url, 'uid': uid},
+        {'uid': 'no_url'},
+        'not_an_object',
+        {'url': url, 'uid': 'other_uid', 'ttl': '1s'},
+    ]
+    mocked_storage.multi_set.return_value = [True, False, True]
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+
+    result = await handlers.multi_shortify(
+        entries, mocked_storage, mocked_jobs
+    )
+
+    assert [r.get('uid') for r in result] == [uid, None, None, None, 'other_uid']  # noqa
+    assert all('error' in r for r in result[1:4])
+    stored = list(mocked_storage.multi_set.call_args.args[0])
+    assert stored == [
+        (utils.url_storage_key(uid), url, ttl),
+        (utils.url_storage_key(uid), url, 12 * 60 * 60),
+        (utils.url_storage_key('other_uid'), url, ttl),
+    ]
+    assert mocked_storage.multi_set.call_args.kwargs == {'nx': True}
+    assert mocked_storage.multi_set.call_count == 1
+    submitted = list(mocked_jobs.multi_submit.call_args.args[0])
+    assert submitted == [('other_uid', url, ttl)]
+
+
+@pytest.mark.asyncio
+async def test_multi_resolve__mixed_uids__per_uid_status(mocked_storage, url):
+    uids = ['ready', 'pending', 'missing', 'lost', 'unknown']
+    ttls = {
+        **dict(zip(map(utils.url_storage_key, uids), [10, -1, 10, 10, -2])),
+        'content': 10,
+        'expired': -2,
+    }
+
+    values = [
+        url, url, url, url, None, 'content', None, None, 'expired', None
+    ]
+    keys = [
+        *map(utils.url_storage_key, uids), *map(utils.clip_storage_key, uids)
+    ]
+
+    async def multi_ttl(*keys):
+        return [ttls[k] for k in keys]
+
+    mocked_storage.multi_get_ttl.return_value = [
+        (value, ttls.get(key, -1)) for key, value in zip(keys, values)
+    ]
+    mocked_storage.multi_ttl.side_effect = multi_ttl
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+    mocked_jobs.multi_state.return_value = [None, JobState.PENDING, None, None, None]  # noqa
+
+    result = await handlers.multi_resolve(uids, mocked_storage, mocked_jobs)
+
+    assert result == [
+        {'uid': 'ready', 'url': url, 'ttl': 10, 'clip': const.CLIP_READY},
+        {'uid': 'pending', 'url': url, 'ttl': None, 'clip': 'pending'},
+        {'uid': 'missing', 'url': url, 'ttl': 10, 'clip': const.CLIP_MISSING},  # noqa
+        {'uid': 'lost', 'url': url, 'ttl': 10, 'clip': const.CLIP_MISSING},
+        {'uid': 'unknown', 'url': None, 'ttl': None, 'clip': None},
+    ]
+    mocked_storage.multi_get_ttl.assert_called_once_with(*keys)
+    assert mocked_storage.multi_ttl.call_count == 1
+    assert sorted(mocked_storage.multi_ttl.call_args.args) == ['content', 'expired']  # noqa
+
+
+@pytest.mark.asyncio
+async def test_shortify__custom_uid_exists__exception(
+        mocked_storage,
+        url,
+        uid
+):
+    mocked_storage.set.return_value = False
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+
+    with pytest.raises(UIDAlreadyExists):
+        await handlers.shortify(
+            {'url': url, 'uid': uid}, mocked_storage, mocked_jobs
+        )
+
+    mocked_storage.set.assert_called_once()
+    mocked_jobs.submit.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_shortify__generated_uid_collision__retried(mocked_storage, url):
+    mocked_storage.set.side_effect = [False] * 4 + [True]
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+
+    result = await handlers.shortify({'url': url}, mocked_storage, mocked_jobs)
+
+    assert mocked_storage.set.call_count == 5
+    assert len(result) == const.DEFAULT_UID_LEN + 1
+    mocked_jobs.submit.assert_called_with(result, url, mocked_jobs.submit.call_args.args[2])  # noqa
+
+
+@pytest.mark.asyncio
+async def test_multi_shortify__generated_uid_collision__retried(
+        mocked_storage,
+        url
+):
+    mocked_storage.multi_set.side_effect = [[False, True], [True]]
+    mocked_jobs = AsyncMock(name='mocked_jobs')
+
+    result = await handlers.multi_shortify(
+        [{'url': url}, {'url': url}], mocked_storage, mocked_jobs
+    )
+
+    assert all('uid' in r for r in result)
+    assert mocked_storage.multi_set.call_count == 2
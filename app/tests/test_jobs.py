@@ -0,0 +1,251 @@
+import asyncio
+
+import pytest
+import ujson
+import redis.asyncio as redis
+
+from unittest.mock import AsyncMock, MagicMock
+
+import utils
+
+from jobs import ClipJobs, RedisClipJobs, JobState, Overflow
+from exceptions import ClipQueueFull
+
+
+async def _failing(*_):
+    raise RuntimeError('test')
+
+
+@pytest.mark.asyncio
+async def test_clip_jobs_submit__running_job__in_progress(uid, url, ttl):
+    event = asyncio.Event()
+    calls = []
+
+    async def run(*args):
+        calls.append(args)
+        await event.wait()
+
+    jobs = ClipJobs(run, workers=1)
+    jobs.start()
+
+    await jobs.submit(uid, url, ttl)
+
+    assert await jobs.in_progress(uid)
+    assert await jobs.state(uid) == JobState.PENDING
+
+    await asyncio.sleep(0)
+
+    assert await jobs.state(uid) == JobState.RUNNING
+    assert (await jobs.stats())['running'] == 1
+
+    event.set()
+    await jobs.close()
+
+    assert calls == [(uid, url, ttl)]
+    assert not await jobs.in_progress(uid)
+    assert await jobs.state(uid) is None
+    assert jobs.depth == 0
+
+
+@pytest.mark.asyncio
+async def test_clip_jobs_submit__failed_job__failed_state(uid, url, ttl):
+    jobs = ClipJobs(_failing, workers=1)
+    jobs.start()
+
+    await jobs.submit(uid, url, ttl)
+    await jobs.close()
+
+    assert not await jobs.in_progress(uid)
+    assert await jobs.state(uid) == JobState.FAILED
+    assert (await jobs.stats())['failed'] == 1
+
+
+@pytest.mark.asyncio
+async def test_clip_jobs_submit__failed_size_exceeded__oldest_forgotten(url):
+    jobs = ClipJobs(_failing, workers=1, failed_size=1)
+    jobs.start()
+
+    await jobs.submit('a', url, None)
+    await jobs.submit('b', url, None)
+    await jobs.close()
+
+    assert await jobs.state('a') is None
+    assert await jobs.state('b') == JobState.FAILED
+
+
+@pytest.mark.asyncio
+async def test_clip_jobs_submit__full_queue_skip__job_skipped(url):
+    jobs = ClipJobs(_failing, queue_size=1, overflow=Overflow.SKIP)
+
+    assert await jobs.submit('a', url, None)
+    assert not await jobs.submit('b', url, None)
+    assert await jobs.in_progress('a')
+    assert not await jobs.in_progress('b')
+
+
+@pytest.mark.asyncio
+async def test_clip_jobs_submit__full_queue_shed__oldest_shed(url):
+    jobs = ClipJobs(_failing, queue_size=1, overflow=Overflow.SHED)
+
+    assert await jobs.submit('a', url, None)
+    assert await jobs.submit('b', url, None)
+    assert not await jobs.in_progress('a')
+    assert await jobs.in_progress('b')
+
+
+@pytest.mark.asyncio
+async def test_clip_jobs_ensure_capacity__full_queue_reject__exception(url):
+    jobs = ClipJobs(_failing, queue_size=1, overflow=Overflow.REJECT)
+    await jobs.ensure_capacity()
+    await jobs.submit('a', url, None)
+
+    with pytest.raises(ClipQueueFull):
+        await jobs.ensure_capacity()
+
+
+@pytest.mark.asyncio
+async def test_clip_jobs_close__pending_jobs__drained(url):
+    run = AsyncMock(name='run')
+    jobs = ClipJobs(run, workers=2)
+    jobs.start()
+
+    for uid in range(10):
+        await jobs.submit(str(uid), url, None)
+    await jobs.close()
+
+    assert run.call_count == 10
+    assert not await jobs.submit('a', url, None)
+
+
+@pytest.mark.asyncio
+async def test_clip_jobs_close__timeout__workers_cancelled(uid, url):
+    jobs = ClipJobs(lambda *_: asyncio.Event().wait(), workers=1)
+    jobs.start()
+
+    await jobs.submit(uid, url, None)
+    await jobs.close(timeout=0.01)
+
+    assert all(w.done() for w in jobs._workers)
+
+
+def _redis_clip_jobs(**kwargs) -> tuple[RedisClipJobs, AsyncMock, AsyncMock]:
+    mocked_client = AsyncMock(name='mocked_client')
+    mocked_pipe = AsyncMock(name='mocked_pipe')
+    mocked_pipe.__aenter__.return_value = mocked_pipe
+    mocked_pipe.set = MagicMock()
+    mocked_pipe.lpush = MagicMock()
+    mocked_pipe.rpop = MagicMock()
+    mocked_pipe.delete = MagicMock()
+    mocked_pipe.lrem = MagicMock()
+    mocked_client.pipeline = MagicMock(return_value=mocked_pipe)
+
+    jobs = RedisClipJobs('host', _client=lambda **_: mocked_client, **kwargs)
+
+    return jobs, mocked_client, mocked_pipe
+
+
+@pytest.mark.asyncio
+async def test_redis_clip_jobs_submit__job__queued_with_state(uid, url, ttl):
+    jobs, mocked_client, mocked_pipe = _redis_clip_jobs()
+    mocked_client.llen.return_value = 0
+
+    assert await jobs.submit(uid, url, ttl)
+
+    mocked_pipe.set.assert_called_with(utils.clip_job_key(uid), JobState.PENDING.value, ex=jobs.state_ttl)  # noqa
+    payload = mocked_pipe.lpush.call_args.args[1]
+    assert ujson.loads(payload) == {'uid': uid, 'url': url, 'ttl': ttl}
+
+
+@pytest.mark.asyncio
+async def test_redis_clip_jobs_submit__full_queue_skip__skipped(uid, url):
+    jobs, mocked_client, mocked_pipe = _redis_clip_jobs(queue_size=1)
+    mocked_client.llen.return_value = 1
+
+    assert not await jobs.submit(uid, url, None)
+    mocked_pipe.lpush.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_redis_clip_jobs_in_progress__pending_state__true(uid):
+    jobs, mocked_client, _ = _redis_clip_jobs()
+    mocked_client.get.return_value = JobState.PENDING.value.encode()
+
+    assert await jobs.in_progress(uid)
+    mocked_client.get.assert_called_with(utils.clip_job_key(uid))
+
+
+@pytest.mark.asyncio
+async def test_redis_clip_jobs_consume__job__run_and_acked(uid, url, ttl):
+    jobs, mocked_client, mocked_pipe = _redis_clip_jobs()
+    payload = ujson.dumps({'uid': uid, 'url': url, 'ttl': ttl})
+    mocked_client.rpoplpush.return_value = None
+    mocked_client.brpoplpush.return_value = payload
+    run = AsyncMock(name='run')
+    mocked_pipe.execute.side_effect = asyncio.CancelledError
+
+    with pytest.raises(asyncio.CancelledError):
+        await jobs.consume(run, 'test')
+
+    run.assert_called_with(uid, url, ttl)
+    mocked_pipe.delete.assert_called_with(utils.clip_job_key(uid))
+    mocked_pipe.lrem.assert_called_with(f'{jobs.PROCESSING_KEY}:test', 1, payload)  # noqa
+
+
+@pytest.mark.asyncio
+async def test_redis_clip_jobs_multi_submit__full_queue_skip__partially_queued(  # noqa
+        url
+):
+    jobs, mocked_client, mocked_pipe = _redis_clip_jobs(queue_size=3)
+    mocked_client.llen.return_value = 1
+
+    result = await jobs.multi_submit((str(i), url, None) for i in range(3))
+
+    assert result == [True, True, False]
+    assert mocked_pipe.lpush.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_clip_jobs_reap__dead_consumer__jobs_requeued(uid, url):
+    jobs, mocked_client, _ = _redis_clip_jobs()
+    payload = ujson.dumps({'uid': uid, 'url': url, 'ttl': None})
+    alive_key = f'{jobs.HEARTBEAT_KEY}:alive'
+
+    async def scan_iter(match):
+        for consumer_id in ('alive', 'dead'):
+            yield f'{jobs.PROCESSING_KEY}:{consumer_id}'.encode()
+
+    mocked_client.scan_iter = scan_iter
+    mocked_client.exists.side_effect = lambda key: key == alive_key
+    mocked_client.rpoplpush.side_effect = [payload, None]
+
+    assert await jobs.reap() == 1
+
+    mocked_client.rpoplpush.assert_called_with(f'{jobs.PROCESSING_KEY}:dead', jobs.QUEUE_KEY)  # noqa
+    mocked_client.set.assert_called_with(utils.clip_job_key(uid), JobState.PENDING.value, ex=jobs.state_ttl)  # noqa
+
+
+@pytest.mark.asyncio
+async def test_redis_clip_jobs_consume__started__heartbeat_set():
+    jobs, mocked_client, _ = _redis_clip_jobs(heartbeat_ttl=10)
+    mocked_client.rpoplpush.return_value = None
+    mocked_client.brpoplpush.side_effect = asyncio.CancelledError
+
+    with pytest.raises(asyncio.CancelledError):
+        await jobs.consume(AsyncMock(name='run'), 'test')
+
+    mocked_client.set.assert_called_with(f'{jobs.HEARTBEAT_KEY}:test', 1, ex=10)  # noqa
+
+
+@pytest.mark.asyncio
+async def test_redis_clip_jobs_consume__redis_error__consuming_resumed():
+    jobs, mocked_client, _ = _redis_clip_jobs()
+    mocked_client.rpoplpush.return_value = None
+    mocked_client.brpoplpush.side_effect = [
+        redis.ConnectionError('test'), asyncio.CancelledError
+    ]
+
+    with pytest.raises(asyncio.CancelledError):
+        await jobs.consume(AsyncMock(name='run'), 'test', retry_timeout=0)
+
+    assert mocked_client.brpoplpush.call_count == 2
+    assert mocked_client.rpoplpush.call_count == 2
@@ -0,0 +1,61 @@
+import pytest
+
+from metrics import Counter, Histogram, Registry, timed
+
+
+def test_counter_render__labels__exposition_lines():
+    counter = Counter('requests_total', 'Requests', ('route', 'status'))
+
+    counter.labels('redirect', '302').inc()
+    counter.labels('redirect', '302').inc(2)
+
+    assert list(counter.render()) == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{route="redirect",status="302"} 3.0',
+    ]
+
+
+def test_counter_labels__wrong_number__exception():
+    counter = Counter('requests_total', 'Requests', ('route',))
+
+    with pytest.raises(ValueError):
+        counter.labels('redirect', '302')
+
+
+def test_histogram_observe__values__cumulative_buckets():
+    histogram = Histogram('duration', 'Duration', buckets=(0.1, 1.0))
+
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value)
+
+    assert list(histogram.render())[2:] == [
+        'duration_bucket{le="0.1"} 2',
+        'duration_bucket{le="1.0"} 3',
+        'duration_bucket{le="+Inf"} 4',
+        'duration_sum 5.65',
+        'duration_count 4',
+    ]
+
+
+def test_registry_render__metrics__joined():
+    registry = Registry()
+    registry.register(Counter('a_total', 'A')).inc()
+    registry.register(Counter('b_total', 'B'))
+
+    assert registry.render().splitlines()[2] == 'a_total 1.0'
+    assert registry.render().endswith('b_total 0.0\n')
+
+
+@pytest.mark.asyncio
+async def test_timed__exception__observed():
+    histogram = Histogram('duration', 'Duration')
+
+    @timed(histogram)
+    async def failing():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        await failing()
+
+    assert histogram.labels().count == 1
@@ -0,0 +1,110 @@
+import gzip
+
+import brotli
+import pytest
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from middlewares import compression_middleware, CompressedCache
+
+BODY = 'lnk ' * 1000
+
+
+def _app(**kwargs):
+    app = web.Application(middlewares=[compression_middleware(**kwargs)])
+
+    async def page(_):
+        return web.Response(text=BODY, headers={'ETag': '"etag"'})
+
+    async def small(_):
+        return web.Response(text='pong')
+
+    async def image(_):
+        return web.Response(body=b'\x89PNG' * 1000, content_type='image/png')
+
+    async def empty(_):
+        return web.Response(status=304)
+
+    app.router.add_get('/page', page)
+    app.router.add_get('/small', small)
+    app.router.add_get('/image', image)
+    app.router.add_get('/empty', empty)
+
+    return app
+
+
+@pytest.mark.parametrize(
+        "accept_encoding, expected",
+        [
+            ('gzip, deflate, br', 'br'),
+            ('gzip, deflate', 'gzip'),
+            ('br;q=0, deflate', 'deflate'),
+        ]
+)
+@pytest.mark.asyncio
+async def test_compression__accepted__preferred_coding(
+        accept_encoding,
+        expected
+):
+    async with TestClient(TestServer(_app())) as client:
+        response = await client.get(
+            '/page', headers={'Accept-Encoding': accept_encoding}
+        )
+
+        assert response.headers['Content-Encoding'] == expected
+        assert response.headers['ETag'] == 'W/"etag"'
+        assert await response.text() == BODY
+
+
+@pytest.mark.parametrize("path", ['/small', '/image', '/empty'])
+@pytest.mark.asyncio
+async def test_compression__small_incompressible_or_empty__skipped(path):
+    async with TestClient(TestServer(_app())) as client:
+        response = await client.get(
+            path, headers={'Accept-Encoding': 'gzip'}
+        )
+
+        assert 'Content-Encoding' not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_compression__no_accept_encoding__identity():
+    async with TestClient(TestServer(_app())) as client:
+        response = await client.get(
+            '/page', headers={'Accept-Encoding': 'identity'}
+        )
+
+        assert 'Content-Encoding' not in response.headers
+
+
+@pytest.mark.parametrize("size, compressed", [(100, False), (2000, True)])
+@pytest.mark.asyncio
+async def test_compression__static_file__compressed_over_min_size(
+        tmp_path,
+        size,
+        compressed
+):
+    (tmp_path / 'about.txt').write_text('a' * size)
+    app = _app()
+    app.router.add_static('/static', tmp_path)
+
+    async with TestClient(TestServer(app)) as client:
+        response = await client.get(
+            '/static/about.txt', headers={'Accept-Encoding': 'gzip'}
+        )
+
+        assert ('Content-Encoding' in response.headers) == compressed
+        assert await response.text() == 'a' * size
+
+
+def test_compressed_cache_compress__same_body__compressed_once():
+    cache = CompressedCache()
+    body = BODY.encode()
+
+    first = cache.compress(body, 'gzip')
+    second = cache.compress(bytes(body), 'gzip')
+
+    assert first is second
+    assert gzip.decompress(first) == body
+    assert brotli.decompress(cache.compress(body, 'br')) == body
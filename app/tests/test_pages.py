@@ -0,0 +1,109 @@
+import pytest
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from pages import RenderedPage, PageCache, etag_matches, is_large, stream_page
+
+
+def test_rendered_page__body__content_etag():
+    page = RenderedPage(b'<html></html>')
+
+    assert page.etag == RenderedPage(b'<html></html>').etag
+    assert page.etag != RenderedPage(b'<html>1</html>').etag
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ('"a"', True),
+        ('W/"a"', True),
+        ('"b", "a"', True),
+        ('"b",W/"a"', True),
+        ('*', True),
+        ('"b"', False),
+        ('"ab"', False),
+        ('"b,a"', False),
+        ('', False),
+    ]
+)
+def test_etag_matches__if_none_match__weak_comparison(header, expected):
+    assert etag_matches(header, '"a"') == expected
+    assert etag_matches(header, 'W/"a"') == expected
+
+
+def test_page_cache_get__same_variant__page(url):
+    cache = PageCache()
+    page = RenderedPage(b'<html></html>')
+
+    cache.set('a', (url, '1h 0m'), page)
+
+    assert cache.get('a', (url, '1h 0m')) is page
+    assert cache.stats['hits'] == 1
+
+
+def test_page_cache_get__other_variant__dropped(url):
+    cache = PageCache()
+
+    cache.set('a', (url, '1h 0m'), RenderedPage(b'<html></html>'))
+
+    assert cache.get('a', (url, '0h 59m')) is None
+    assert cache.stats['size'] == 0
+
+
+def test_page_cache_set__size_exceeded__lru_evicted(url):
+    cache = PageCache(size=1)
+    page = RenderedPage(b'<html></html>')
+
+    cache.set('a', url, page)
+    cache.set('b', url, page)
+
+    assert cache.get('a', url) is None
+    assert cache.get('b', url) is page
+
+
+def test_page_cache_invalidate__uid__dropped(url):
+    cache = PageCache()
+
+    cache.set('a', url, RenderedPage(b'<html></html>'))
+    cache.invalidate('a')
+
+    assert cache.get('a', url) is None
+
+
+def test_is_large__clip_fields__any_field_over_threshold():
+    assert is_large({'content': 'a' * 11}, 10)
+    assert is_large({'content': 'a', 'textContent': 'a' * 11}, 10)
+    assert not is_large({'content': 'a' * 10}, 10)
+    assert not is_large(None, 10)
+
+
+@pytest.mark.asyncio
+async def test_stream_page__fragments__chunked_body(monkeypatch):
+    async def fragments():
+        yield '<html>'
+        yield 'a' * 100
+        yield '</html>'
+
+    writes = []
+    write = web.StreamResponse.write
+
+    async def recorded_write(self, data):
+        writes.append(len(data))
+        await write(self, data)
+
+    monkeypatch.setattr(web.StreamResponse, 'write', recorded_write)
+
+    async def page(request):
+        return await stream_page(request, {}, fragments(), 30)
+
+    app = web.Application()
+    app.router.add_get('/page', page)
+
+    async with TestClient(TestServer(app)) as client:
+        response = await client.get('/page')
+
+        assert response.headers['Transfer-Encoding'] == 'chunked'
+        assert 'Content-Length' not in response.headers
+        assert await response.text() == '<html>' + 'a' * 100 + '</html>'
+        assert max(writes) == 30
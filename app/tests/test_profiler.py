@@ -0,0 +1,62 @@
+import time
+import asyncio
+import logging
+import collections
+
+import pytest
+
+import constants as const
+
+from profiler import LoopMonitor, SamplingProfiler, fold
+from exceptions import ProfilingInProgress
+
+
+def _block_loop(seconds):
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_loop_monitor__blocked_loop__stack_logged(caplog):
+    monitor = LoopMonitor(interval=0.01, slow_threshold=0.05)
+
+    with caplog.at_level(logging.WARNING, logger=const.LNK):
+        monitor.start()
+        await asyncio.sleep(0.02)
+        _block_loop(0.3)
+        await asyncio.sleep(0.02)
+        await monitor.close()
+
+    messages = [r.getMessage() for r in caplog.records]
+    assert any('_block_loop' in m for m in messages)
+    assert any(m.startswith('event loop lagged') for m in messages)
+
+
+@pytest.mark.asyncio
+async def test_sampling_profiler_profile__seconds__folded_stacks():
+    profiler = SamplingProfiler(interval=0.001)
+
+    stacks = await profiler.profile(0.05)
+
+    assert stacks
+    for line in stacks.splitlines():
+        stack, count = line.rsplit(' ', 1)
+        assert int(count) > 0
+        assert ';' in stack
+
+
+@pytest.mark.asyncio
+async def test_sampling_profiler_profile__concurrent__exception():
+    profiler = SamplingProfiler(interval=0.001)
+
+    first, second = await asyncio.gather(
+        profiler.profile(0.05), profiler.profile(0.05), return_exceptions=True
+    )
+
+    assert isinstance(first, str)
+    assert isinstance(second, ProfilingInProgress)
+
+
+def test_fold__stacks__most_common_first():
+    stacks = {('main', 'a'): 1, ('main', 'b'): 3}
+
+    assert fold(collections.Counter(stacks)) == 'main;b 3\nmain;a 1\n'
@@ -0,0 +1,782 @@
+import os
+import asyncio
+
+import pytest
+import ujson
+import zstandard
+
+from unittest.mock import patch, AsyncMock, MagicMock
+
+from storage import (
+    Redis,
+    RedisCluster,
+    RedisSentinel,
+    Sqlite,
+    Memory,
+    redis_storage,
+    Fake,
+    Cached,
+    RedisInvalidationBus,
+    RawSerializer,
+    JsonSerializer,
+    GzipJsonSerializer,
+    ZstdJsonSerializer,
+    Lz4JsonSerializer,
+    TaggedSerializer,
+    tagged_serializer,
+)
+
+
+def _stored(value, ttl):
+    async def multi_get_ttl(*keys):
+        return [(value, ttl) for _ in keys]
+
+    return multi_get_ttl
+
+
+@pytest.mark.asyncio
+async def test_cached_get__repeated_get__storage_called_once(
+        mocked_storage,
+        url,
+        uid
+):
+    mocked_storage.multi_get_ttl.side_effect = _stored(url, 100)
+    cached = Cached(mocked_storage)
+
+    assert await cached.get(uid) == url
+    assert await cached.get(uid) == url
+
+    mocked_storage.multi_get_ttl.assert_called_once_with(uid)
+    assert cached.stats['hits'] == 1
+    assert cached.stats['misses'] == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_get__expired_entry__storage_called_again(
+        mocked_storage,
+        url,
+        uid
+):
+    now = 0
+    mocked_storage.multi_get_ttl.side_effect = _stored(url, 5)
+    cached = Cached(mocked_storage, max_ttl=60, _timer=lambda: now)
+
+    await cached.get(uid)
+    now = 5
+    await cached.get(uid)
+
+    assert mocked_storage.multi_get_ttl.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_get__none_value__not_cached(mocked_storage, uid):
+    mocked_storage.multi_get_ttl.side_effect = _stored(None, -2)
+    cached = Cached(mocked_storage)
+
+    await cached.get(uid)
+    await cached.get(uid)
+
+    assert mocked_storage.multi_get_ttl.call_count == 2
+    assert cached.stats['size'] == 0
+
+
+@pytest.mark.asyncio
+async def test_cached_get__negative_ttl__missing_cached(mocked_storage, uid):
+    now = 0
+    mocked_storage.multi_get_ttl.side_effect = _stored(None, -2)
+    cached = Cached(mocked_storage, negative_ttl=5, _timer=lambda: now)
+
+    assert await cached.get(uid) is None
+    assert await cached.multi_get_ttl(uid) == [(None, -2)]
+    now = 5
+    await cached.get(uid)
+
+    assert mocked_storage.multi_get_ttl.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_set__written__served_locally(mocked_storage, url, uid):
+    mocked_storage.multi_get_ttl.side_effect = _stored(None, -2)
+    mocked_storage.set.return_value = True
+    cached = Cached(mocked_storage, negative_ttl=5, _timer=lambda: 0)
+
+    await cached.get(uid)
+    await cached.set(uid, url, ttl=100)
+
+    assert await cached.multi_get_ttl(uid) == [(url, 100)]
+    mocked_storage.multi_get_ttl.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_cached_set__not_written__not_cached(mocked_storage, url, uid):
+    mocked_storage.multi_get_ttl.side_effect = _stored(None, -2)
+    mocked_storage.set.return_value = False
+    cached = Cached(mocked_storage)
+
+    await cached.set(uid, url, nx=True)
+    await cached.get(uid)
+
+    mocked_storage.multi_get_ttl.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_cached_get__size_exceeded__lru_evicted(mocked_storage, url):
+    mocked_storage.multi_get_ttl.side_effect = _stored(url, -1)
+    cached = Cached(mocked_storage, size=2)
+
+    for key in ('a', 'b', 'a', 'c', 'a'):
+        await cached.get(key)
+
+    assert mocked_storage.multi_get_ttl.call_count == 3
+    assert cached.stats['evictions'] == 1
+    assert cached.stats['size'] == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_multi_get__partially_cached__missed_fetched(
+        mocked_storage,
+        url,
+        clip
+):
+    mocked_storage.multi_get_ttl.side_effect = [[(url, 100)], [(clip, 100)]]
+    cached = Cached(mocked_storage)
+
+    await cached.get('a')
+    result = await cached.multi_get('a', 'b')
+    await cached.multi_get('b')
+
+    assert result == [url, clip]
+    mocked_storage.multi_get_ttl.assert_called_with('b')
+    assert mocked_storage.multi_get_ttl.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_multi_get_ttl__cached_entry__remaining_ttl(
+        mocked_storage,
+        url,
+        uid
+):
+    now = 0
+    mocked_storage.multi_get_ttl.side_effect = _stored(url, 100)
+    cached = Cached(mocked_storage, max_ttl=60, _timer=lambda: now)
+
+    await cached.get(uid)
+    now = 30
+
+    assert await cached.multi_get_ttl(uid) == [(url, 70)]
+    assert await cached.ttl(uid) == 70
+    mocked_storage.multi_get_ttl.assert_called_once()
+    mocked_storage.ttl.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_cached_multi_delete__cached_key__invalidated(
+        mocked_storage,
+        url,
+        uid
+):
+    mocked_storage.multi_get_ttl.side_effect = _stored(url, 100)
+    cached = Cached(mocked_storage)
+
+    await cached.get(uid)
+    await cached.multi_delete(uid)
+    await cached.get(uid)
+
+    mocked_storage.multi_delete.assert_called_once_with(uid)
+    assert mocked_storage.multi_get_ttl.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_multi_delete__bus__keys_published(mocked_storage, uid):
+    mocked_bus = AsyncMock(name='mocked_bus')
+    cached = Cached(mocked_storage, bus=mocked_bus)
+
+    await cached.multi_delete(uid)
+
+    mocked_bus.publish.assert_called_once_with(uid)
+
+
+@pytest.mark.asyncio
+async def test_cached_set__bus_error__written_and_local_dropped(url, uid):
+    mocked_bus = AsyncMock(name='mocked_bus')
+    mocked_bus.publish.side_effect = ConnectionError('test')
+    storage = Memory()
+    cached = Cached(storage, bus=mocked_bus)
+
+    assert await cached.set(uid, url)
+    assert await cached.multi_delete('other') == 0
+
+    assert cached.stats['size'] == 0
+    assert await storage.get(uid) == url
+
+
+@pytest.mark.asyncio
+async def test_cached_uncached__bulk_reads__hot_entries_kept(url, uid):
+    storage = Memory()
+    cached = Cached(storage, size=4, negative_ttl=10)
+    await storage.set(uid, url)
+    await cached.get(uid)
+
+    await cached.uncached().multi_get(*(str(i) for i in range(10)))
+
+    assert cached.stats['size'] == 1
+    assert await cached.get(uid) == url
+
+
+@pytest.mark.asyncio
+async def test_cached_uncached__bulk_write__local_entries_invalidated(
+        url,
+        uid
+):
+    cached = Cached(Memory(), negative_ttl=10)
+    assert await cached.get(uid) is None
+
+    await cached.uncached().multi_set([(uid, url, None)])
+
+    assert cached.stats['size'] == 0
+    assert await cached.get(uid) == url
+
+
+@pytest.mark.asyncio
+async def test_cached_listen__bus_message__invalidated(
+        mocked_storage,
+        url,
+        uid
+):
+    mocked_storage.multi_get_ttl.side_effect = _stored(url, 100)
+    mocked_bus = AsyncMock(name='mocked_bus')
+    mocked_bus.listen.side_effect = lambda callback: callback(uid)
+    cached = Cached(mocked_storage, bus=mocked_bus)
+
+    await cached.get(uid)
+    with pytest.raises(asyncio.CancelledError):
+        with patch('storage.asyncio.sleep', side_effect=asyncio.CancelledError):  # noqa
+            await cached.listen()
+    await cached.get(uid)
+
+    assert mocked_storage.multi_get_ttl.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_invalidation_bus_publish__keys__json_message(uid):
+    mocked_client = AsyncMock(name='mocked_client')
+    bus = RedisInvalidationBus('host', _client=lambda **_: mocked_client)
+
+    await bus.publish(uid)
+
+    channel, message = mocked_client.publish.call_args.args
+    assert channel == bus.channel
+    assert ujson.loads(message) == {'node': bus.node_id, 'keys': [uid]}
+
+
+@pytest.mark.asyncio
+async def test_redis_invalidation_bus_listen__own_message__skipped(uid):
+    mocked_client = MagicMock(name='mocked_client')
+    bus = RedisInvalidationBus('host', _client=lambda **_: mocked_client)
+    other = RedisInvalidationBus('host', _client=lambda **_: mocked_client)
+
+    async def listen():
+        for publisher, key in ((bus, 'own'), (other, uid)):
+            data = {'node': publisher.node_id, 'keys': [key]}
+            yield {'type': 'message', 'data': ujson.dumps(data)}
+
+    pubsub = AsyncMock(name='pubsub')
+    pubsub.listen = listen
+    mocked_client.pubsub.return_value = pubsub
+    callback = MagicMock(name='callback')
+
+    await bus.listen(callback)
+
+    callback.assert_called_once_with(uid)
+
+
+@pytest.mark.asyncio
+async def test_fake_multi_set__items__stored(url, clip):
+    storage = Fake()
+
+    await storage.multi_set([('a', url, 1), ('b', clip, None)])
+
+    assert await storage.multi_get('a', 'b') == [url, clip]
+
+
+@pytest.mark.asyncio
+async def test_fake_set__nx_existing_key__not_written(url, clip):
+    storage = Fake()
+
+    assert await storage.set('a', url, nx=True)
+    assert not await storage.set('a', clip, nx=True)
+    assert await storage.get('a') == url
+
+
+@pytest.mark.asyncio
+async def test_redis_multi_set__items__pipelined_batches(url):
+    mocked_client = AsyncMock(name='mocked_client')
+    mocked_pipe = AsyncMock(name='mocked_pipe')
+    mocked_pipe.__aenter__.return_value = mocked_pipe
+    mocked_pipe.set = MagicMock()
+    mocked_client.pipeline = MagicMock(return_value=mocked_pipe)
+    storage = Redis('host', batch_size=2, _client=lambda **_: mocked_client)
+
+    mocked_pipe.execute.side_effect = [[True, True], [True, None], [True]]
+
+    written = await storage.multi_set(
+        ((str(i), url, 1) for i in range(5)), nx=True
+    )
+
+    assert written == [True, True, True, False, True]
+    assert mocked_pipe.execute.call_count == 3
+    assert mocked_pipe.set.call_count == 5
+    mocked_pipe.set.assert_called_with('4', url, ex=1, nx=True)
+
+
+@pytest.mark.asyncio
+async def test_fake_multi_ttl__keys__persistent_or_missing(url):
+    storage = Fake()
+    await storage.set('a', url)
+
+    assert await storage.multi_ttl('a', 'b') == [-1, -2]
+
+
+@pytest.mark.asyncio
+async def test_redis_multi_get_ttl__keys__single_pipeline(url, clip):
+    mocked_client = AsyncMock(name='mocked_client')
+    mocked_pipe = AsyncMock(name='mocked_pipe')
+    mocked_pipe.__aenter__.return_value = mocked_pipe
+    mocked_pipe.mget = MagicMock()
+    mocked_pipe.ttl = MagicMock()
+    mocked_pipe.execute.return_value = [[url, clip], 10, -1]
+    mocked_client.pipeline = MagicMock(return_value=mocked_pipe)
+    storage = Redis('host', _client=lambda **_: mocked_client)
+
+    result = await storage.multi_get_ttl('a', 'b')
+
+    assert result == [(url, 10), (clip, -1)]
+    mocked_pipe.mget.assert_called_once_with('a', 'b')
+    mocked_pipe.execute.assert_called_once()
+
+
+@pytest.mark.parametrize(
+        "obj_serializer",
+        [
+            JsonSerializer(),
+            GzipJsonSerializer(),
+            ZstdJsonSerializer(),
+            Lz4JsonSerializer(),
+        ]
+)
+def test_tagged_serializer__values__roundtrip(obj_serializer, url, clip):
+    serializer = TaggedSerializer(obj=obj_serializer)
+
+    url_data = serializer.dumps(url)
+    clip_data = serializer.dumps(clip)
+
+    assert url_data == RawSerializer.TAG + url.encode()
+    assert clip_data.startswith(obj_serializer.TAG)
+    assert serializer.loads(url_data) == url
+    assert serializer.loads(clip_data) == clip
+    assert serializer.dumps(None) is None
+    assert serializer.loads(None) is None
+
+
+def test_tagged_serializer_loads__legacy_gzip__value(url, clip):
+    serializer = TaggedSerializer()
+    legacy = GzipJsonSerializer()
+
+    assert serializer.loads(legacy.dumps(url)) == url
+    assert serializer.loads(legacy.dumps(clip)) == clip
+
+
+def test_tagged_serializer_loads__other_codec__value(clip):
+    data = TaggedSerializer(obj=Lz4JsonSerializer()).dumps(clip)
+
+    assert TaggedSerializer().loads(data) == clip
+
+
+def test_tagged_serializer_loads__unknown_tag__exception():
+    with pytest.raises(ValueError):
+        TaggedSerializer().loads(b'?data')
+
+
+def test_zstd_json_serializer__dictionary__roundtrip(clip):
+    samples = [
+        ujson.dumps({'title': f'title {i}', 'content': f'<p>{i}</p>' * i}).encode()  # noqa
+        for i in range(100)
+    ]
+    dictionary = zstandard.train_dictionary(1024, samples).as_bytes()
+    serializer = ZstdJsonSerializer(dictionary=dictionary)
+
+    assert serializer.loads(serializer.dumps(clip)) == clip
+
+
+@pytest.mark.asyncio
+async def test_redis_multi_get__large_value__loaded_in_executor(clip):
+    serializer = TaggedSerializer()
+    small, large = serializer.dumps('a'), serializer.dumps(clip)
+    mocked_client = AsyncMock(name='mocked_client')
+    mocked_client.mget.return_value = [small, large]
+    storage = Redis(
+        'host',
+        serializer=serializer,
+        offload_threshold=len(large),
+        _client=lambda **_: mocked_client
+    )
+    loop = asyncio.get_running_loop()
+
+    with patch.object(
+            loop, 'run_in_executor', wraps=loop.run_in_executor
+    ) as mocked_run:
+        result = await storage.multi_get('a', 'b')
+
+    assert result == ['a', clip]
+    mocked_run.assert_called_once_with(
+        storage._executor, serializer.loads, large
+    )
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_redis_multi_set_get__concurrent_offloaded_zstd__roundtrip():
+    values = [
+        {'content': f'<p>{i}</p>' * 20000 + os.urandom(512).hex()}
+        for i in range(16)
+    ]
+    stored = {}
+
+    async def mget(*keys):
+        return [stored[k] for k in keys]
+
+    mocked_client = AsyncMock(name='mocked_client')
+    mocked_client.mget.side_effect = mget
+    serializer = tagged_serializer('zstd')
+    storage = Redis(
+        'host',
+        serializer=serializer,
+        offload_threshold=64 * 1024,
+        offload_workers=8,
+        _client=lambda **_: mocked_client
+    )
+
+    dumped = await asyncio.gather(*(storage._dumps(v) for v in values))
+    stored.update((str(i), d) for i, d in enumerate(dumped))
+
+    for _ in range(4):
+        loaded = await asyncio.gather(*(
+            storage.multi_get(str(i)) for i in range(len(values))
+        ))
+
+        assert [v for v, in loaded] == values
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_redis_get__auto_batch__concurrent_gets_single_mget(url, clip):
+    mocked_client = AsyncMock(name='mocked_client')
+    mocked_client.mget.return_value = [url, clip]
+    storage = Redis(
+        'host', auto_batch=True, _client=lambda **_: mocked_client
+    )
+
+    result = await asyncio.gather(
+        storage.get('a'), storage.get('b'), storage.get('a')
+    )
+
+    assert result == [url, clip, url]
+    mocked_client.mget.assert_called_once_with('a', 'b')
+    mocked_client.get.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_redis_get__auto_batch_error__raised_to_all(uid):
+    mocked_client = AsyncMock(name='mocked_client')
+    mocked_client.mget.side_effect = ConnectionError()
+    storage = Redis(
+        'host', auto_batch=True, _client=lambda **_: mocked_client
+    )
+
+    result = await asyncio.gather(
+        storage.get(uid), storage.get('b'), return_exceptions=True
+    )
+
+    assert all(isinstance(r, ConnectionError) for r in result)
+
+
+def test_redis__pool_options__passed_to_client():
+    mocked_factory = MagicMock(name='mocked_factory')
+
+    Redis(
+        'host',
+        max_connections=10,
+        socket_timeout=1.5,
+        socket_keepalive=True,
+        _client=mocked_factory
+    )
+
+    mocked_factory.assert_called_once_with(
+        host='host',
+        port=6379,
+        decode_responses=False,
+        health_check_interval=0,
+        max_connections=10,
+        socket_timeout=1.5,
+        socket_keepalive=True,
+    )
+
+
+@pytest.mark.asyncio
+async def test_redis_cluster_multi_get__keys__nonatomic_mget(url, clip):
+    mocked_client = AsyncMock(name='mocked_client')
+    mocked_client.mget_nonatomic.return_value = [url, clip]
+    storage = RedisCluster('host', _client=lambda **_: mocked_client)
+
+    assert await storage.multi_get('a', 'b') == [url, clip]
+    mocked_client.mget_nonatomic.assert_called_once_with(('a', 'b'))
+    mocked_client.mget.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_redis_cluster_multi_get_ttl__keys__per_key_pipeline(url):
+    mocked_client = AsyncMock(name='mocked_client')
+    mocked_pipe = AsyncMock(name='mocked_pipe')
+    mocked_pipe.__aenter__.return_value = mocked_pipe
+    mocked_pipe.get = MagicMock()
+    mocked_pipe.ttl = MagicMock()
+    mocked_pipe.execute.return_value = [url, 10, None, -2]
+    mocked_client.pipeline = MagicMock(return_value=mocked_pipe)
+    storage = RedisCluster('host', _client=lambda **_: mocked_client)
+
+    assert await storage.multi_get_ttl('a', 'b') == [(url, 10), (None, -2)]
+    assert mocked_pipe.get.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_sentinel__sentinels__master_client():
+    mocked_sentinel = MagicMock(name='mocked_sentinel')
+    mocked_sentinel.return_value.sentinels = [AsyncMock()]
+    mocked_master = mocked_sentinel.return_value.master_for.return_value
+    mocked_master.close = AsyncMock()
+    mocked_master.connection_pool.disconnect = AsyncMock()
+
+    storage = RedisSentinel(
+        [('s1', 26379), ('s2', 26379)],
+        'lnk',
+        socket_timeout=1,
+        _sentinel=mocked_sentinel
+    )
+    await storage.close()
+
+    mocked_sentinel.assert_called_once_with(
+        [('s1', 26379), ('s2', 26379)],
+        decode_responses=False,
+        health_check_interval=0,
+        socket_timeout=1,
+        socket_keepalive=False,
+    )
+    mocked_sentinel.return_value.master_for.assert_called_once_with('lnk')
+    mocked_master.close.assert_called_once()
+    mocked_sentinel.return_value.sentinels[0].close.assert_called_once()
+
+
+def test_redis_storage__unknown_mode__exception():
+    with pytest.raises(ValueError):
+        redis_storage('replicated', 'host')
+
+
+@pytest.fixture
+async def sqlite_storage(tmp_path):
+    storage = Sqlite(str(tmp_path / 'lnk.db'), serializer=TaggedSerializer())
+
+    yield storage
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_multi_set__items__stored(sqlite_storage, url, clip):
+    written = await sqlite_storage.multi_set([('a', url, 10), ('b', clip, None)])  # noqa
+
+    assert written == [True, True]
+    assert await sqlite_storage.multi_get_ttl('a', 'b', 'c') == [
+        (url, 10), (clip, -1), (None, -2)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_sqlite_get__expired_key__missing(tmp_path, url):
+    now = 0
+    storage = Sqlite(str(tmp_path / 'lnk.db'), _timer=lambda: now)
+
+    await storage.set('a', url, ttl=5)
+    now = 5
+
+    assert await storage.get('a') is None
+    assert await storage.ttl('a') == -2
+    assert await storage.multi_delete('a') == 0
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_set__nx__only_missing_or_expired_written(tmp_path, url):
+    now = 0
+    storage = Sqlite(str(tmp_path / 'lnk.db'), _timer=lambda: now)
+
+    assert await storage.set('a', url, ttl=5, nx=True)
+    assert not await storage.set('a', 'other', nx=True)
+    now = 5
+    assert await storage.set('a', 'other', nx=True)
+    assert await storage.get('a') == 'other'
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_multi_delete__keys__live_deleted(sqlite_storage, url):
+    await sqlite_storage.multi_set([('a', url, None), ('b', url, None)])
+
+    assert await sqlite_storage.multi_delete('a', 'b', 'c') == 2
+    assert await sqlite_storage.multi_get('a', 'b') == [None, None]
+
+
+@pytest.mark.asyncio
+async def test_sqlite__reopened__values_persisted(tmp_path, url, clip):
+    path = str(tmp_path / 'lnk.db')
+    storage = Sqlite(path, serializer=TaggedSerializer())
+    await storage.multi_set([('a', url, None), ('b', clip, None)])
+    await storage.close()
+
+    storage = Sqlite(path, serializer=TaggedSerializer())
+
+    assert await storage.multi_get('a', 'b') == [url, clip]
+    await storage.close()
+
+
+@pytest.mark.parametrize("storage_type", ['sqlite', 'memory'])
+@pytest.mark.asyncio
+async def test_set_shared__refs__lives_with_longest_ref(
+        tmp_path,
+        clip,
+        storage_type
+):
+    now = 0
+    if storage_type == 'sqlite':
+        storage = Sqlite(
+            str(tmp_path / 'lnk.db'),
+            serializer=TaggedSerializer(),
+            _timer=lambda: now
+        )
+    else:
+        storage = Memory(_timer=lambda: now)
+
+    assert await storage.set_shared('v', clip, 'a', ttl=100)
+    assert await storage.set_shared('v', clip, 'b', ttl=10)
+    assert await storage.ttl('v') == 100
+
+    await storage.set_shared('v', clip, 'c')
+    assert await storage.ttl('v') == -1
+
+    assert not await storage.release_shared('v', 'c')
+    assert await storage.ttl('v') == 100
+
+    now = 50
+    assert not await storage.release_shared('v', 'b')
+    assert await storage.multi_get_ttl('v') == [(clip, 50)]
+
+    assert await storage.release_shared('v', 'a')
+    assert await storage.get('v') is None
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_redis_set_shared__value__script_evaluated(clip):
+    mocked_client = AsyncMock(name='mocked_client')
+    mocked_client.eval.return_value = 1
+    serializer = TaggedSerializer()
+    storage = Redis(
+        'host', serializer=serializer, _client=lambda **_: mocked_client
+    )
+
+    assert await storage.set_shared('v', clip, 'a', ttl=1.5)
+    mocked_client.eval.assert_called_with(
+        Redis.SET_SHARED_SCRIPT, 2, 'v', 'v:refs', serializer.dumps(clip), 'a', 1500  # noqa
+    )
+
+    mocked_client.eval.return_value = 0
+    assert await storage.release_shared('v', 'a')
+    mocked_client.eval.assert_called_with(
+        Redis.RELEASE_SHARED_SCRIPT, 2, 'v', 'v:refs', 'a'
+    )
+
+
+@pytest.mark.asyncio
+async def test_cached_set_shared__cached_key__invalidated(
+        mocked_storage,
+        clip
+):
+    mocked_bus = AsyncMock(name='mocked_bus')
+    mocked_storage.multi_get_ttl.return_value = [(clip, -1)]
+    storage = Cached(mocked_storage, bus=mocked_bus)
+
+    await storage.get('v')
+    await storage.set_shared('v', clip, 'a', ttl=10)
+    await storage.get('v')
+
+    assert mocked_storage.multi_get_ttl.call_count == 2
+    mocked_storage.set_shared.assert_called_with('v', clip, 'a', ttl=10)
+    mocked_bus.publish.assert_called_with('v')
+
+
+@pytest.mark.asyncio
+async def test_memory_get__expired_key__missing(url):
+    now = 0
+    storage = Memory(_timer=lambda: now)
+
+    await storage.set('a', url, ttl=5)
+    await storage.set('b', url)
+    now = 3
+    assert await storage.multi_get_ttl('a', 'b') == [(url, 2), (url, -1)]
+    now = 5
+
+    assert await storage.get('a') is None
+    assert await storage.ttl('a') == -2
+    assert await storage.set('a', url, nx=True)
+
+
+@pytest.mark.asyncio
+async def test_memory_set__expired_keys__swept(url):
+    now = 0
+    storage = Memory(_timer=lambda: now)
+
+    await storage.multi_set([(str(i), url, 1) for i in range(10)])
+    now = 1
+    await storage.set('a', url)
+
+    assert storage.stats['size'] == 1
+    assert storage.stats['expired'] == 10
+
+
+@pytest.mark.asyncio
+async def test_memory_set__max_bytes_exceeded__lru_evicted(url):
+    storage = Memory(max_bytes=3 * (Memory.ENTRY_OVERHEAD + 1 + len(url)))
+
+    for key in ('a', 'b', 'c'):
+        await storage.set(key, url)
+    await storage.get('a')
+    await storage.set('d', url)
+
+    assert await storage.multi_get('a', 'b', 'c', 'd') == [url, None, url, url]
+    assert storage.stats['evictions'] == 1
+
+
+@pytest.mark.asyncio
+async def test_memory_close__snapshot__loaded_on_start(tmp_path, url, clip):
+    now = 0
+    path = str(tmp_path / 'lnk.snapshot')
+    storage = Memory(snapshot_path=path, _timer=lambda: now)
+    await storage.multi_set([('a', url, None), ('b', clip, 10), ('c', url, 1)])
+    now = 1
+
+    await storage.close()
+    storage = Memory(snapshot_path=path, _timer=lambda: now)
+
+    assert await storage.multi_get_ttl('a', 'b', 'c') == [
+        (url, -1), (clip, 9), (None, -2)
+    ]
@@ -1,4 +1,5 @@
 import re
+import asyncio
 
 import pytest
 
@@ -67,6 +68,26 @@ def test_clip_storage_key__string__string():
     assert result == f'{LNK}-c:{test_input}'
 
 
+@pytest.mark.parametrize(
+        "first, second",
+        [
+            ('https://Example.com/a?b=1', 'HTTPS://example.COM/a?b=1'),
+            ('https://example.com', 'https://example.com/'),
+            ('https://example.com/a#top', ' https://example.com/a'),
+        ]
+)
+def test_clip_content_key__same_normalized_url__same_key(first, second):
+    assert utils.clip_content_key(first) == utils.clip_content_key(second)
+
+
+def test_clip_content_key__different_urls__different_keys():
+    first = utils.clip_content_key('https://example.com/a')
+    second = utils.clip_content_key('https://example.com/A')
+
+    assert first != second
+    assert first.startswith(f'{LNK}-b:')
+
+
 def test_clip_task_name__string__string():
     test_input = 'test'
     result = utils.clip_task_name(test_input)
@@ -105,3 +126,87 @@ def test_seconds_to_str_time__random_input__formated_str(random_int):
     time = utils.seconds_to_str_time(random_int)
 
     assert re.match(r'\d+h \d+m', time)
+
+
+def test_chunked__text__slices_cover_text():
+    chunks = list(utils.chunked('abcdefg', 3))
+
+    assert chunks == ['abc', 'def', 'g']
+    assert list(utils.chunked('', 3)) == []
+
+
+def test_seconds_to_expiry__ttl__minute_of_expiry():
+    assert utils.seconds_to_expiry(90, 0) == '1970-01-01 00:01 UTC'
+    assert utils.seconds_to_expiry(-1, 0) == 'never'
+
+
+def test_parse_clip_reference__reference__content_key_and_version(url):
+    content_key = utils.clip_content_key(url)
+    version = utils.clip_digest({'content': 'test'})
+
+    ref = utils.clip_reference(content_key, version)
+
+    assert utils.parse_clip_reference(ref) == (content_key, version)
+    assert utils.parse_clip_reference(content_key) == (content_key, None)
+    assert version != utils.clip_digest({'content': 'other'})
+
+
+@pytest.mark.asyncio
+async def test_batcher_load__concurrent_keys__single_fetch():
+    calls = []
+
+    async def fetch(*keys):
+        calls.append(keys)
+        return [key * 2 for key in keys]
+
+    batcher = utils.Batcher(fetch, batch_size=10)
+
+    result = await asyncio.gather(
+        batcher.load('a'), batcher.load('b', 'a')
+    )
+
+    assert result == [['aa'], ['bb', 'aa']]
+    assert calls == [('a', 'b')]
+
+
+@pytest.mark.asyncio
+async def test_batcher_load__batch_size_reached__flushed_without_delay():
+    async def fetch(*keys):
+        return list(keys)
+
+    batcher = utils.Batcher(fetch, batch_size=2, max_delay=10)
+
+    result = await asyncio.wait_for(
+        asyncio.gather(batcher.load('a'), batcher.load('b')), 1
+    )
+
+    assert result == [['a'], ['b']]
+
+
+@pytest.mark.asyncio
+async def test_batcher_load__fetch_failed__all_callers_failed():
+    async def fetch(*keys):
+        raise RuntimeError('test')
+
+    batcher = utils.Batcher(fetch, batch_size=10)
+
+    results = await asyncio.gather(
+        batcher.load('a'), batcher.load('b'), return_exceptions=True
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_batcher_close__pending_keys__fetched():
+    async def fetch(*keys):
+        return list(keys)
+
+    batcher = utils.Batcher(fetch, batch_size=10, max_delay=10)
+
+    task = asyncio.create_task(batcher.load('a'))
+    await asyncio.sleep(0)
+    await batcher.close()
+
+    assert await asyncio.wait_for(task, 1) == ['a']
+    assert batcher._handle is None
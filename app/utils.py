@@ -1,5 +1,12 @@
+import time
+import asyncio
+import hashlib
 import typing as t
 
+import ujson
+
+from urllib.parse import urlsplit, urlunsplit
+
 from constants import TimeUnit, LNK, SECONDS_CALC_MAP, TTL_REGEXP
 
 
@@ -33,6 +40,18 @@ def seconds_to_str_time(seconds: int) -> str:
     return f'{seconds // 3600}h {seconds % 3600 // 60}m'
 
 
+def seconds_to_expiry(seconds: int, now: float) -> str:
+    if seconds < 0:
+        return 'never'
+
+    return time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime(now + seconds))
+
+
+def chunked(text: str, size: int) -> t.Iterator[str]:
+    for i in range(0, len(text), size):
+        yield text[i:i+size]
+
+
 def url_storage_key(key: str) -> str:
     return f'{LNK}-u:{key}'
 
@@ -41,6 +60,51 @@ def clip_storage_key(key: str) -> str:
     return f'{LNK}-c:{key}'
 
 
+def clip_content_key(url: str) -> str:
+    digest = hashlib.blake2b(normalize_url(url).encode(), digest_size=16)
+
+    # digest is a hash tag, so keys derived from it share a cluster slot
+    return f'{LNK}-b:{{{digest.hexdigest()}}}'
+
+
+def clip_digest(clip: t.Any) -> str:
+    data = ujson.dumps(clip, sort_keys=True).encode()
+
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def clip_reference(content_key: str, version: str) -> str:
+    return f'{content_key}#{version}'
+
+
+def parse_clip_reference(ref: str) -> tuple[str, str | None]:
+    # references stored before versioning hold the content key only
+    content_key, _, version = ref.partition('#')
+
+    return content_key, version or None
+
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+
+    # scheme and host are case insensitive, fragment never reaches server
+    return urlunsplit((
+        parts.scheme.lower(),
+        parts.netloc.lower(),
+        parts.path or '/',
+        parts.query,
+        '',
+    ))
+
+
+def clip_job_key(key: str) -> str:
+    return f'{LNK}-j:{key}'
+
+
+def clip_retry_key(key: str) -> str:
+    return f'{LNK}-r:{key}'
+
+
 def clip_task_name(uid: str) -> str:
     return f'clip_{uid}'
 
@@ -59,3 +123,83 @@ def str2bool(value: t.Union[str, bool]) -> bool:
         return False
 
     raise ValueError('unsupported value')
+
+
+class Batcher:
+
+    def __init__(
+            self,
+            fetch: t.Callable[..., t.Awaitable[list[t.Any]]],
+            batch_size: int,
+            max_delay: int | float = 0
+    ):
+        self.fetch = fetch
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+
+        self._pending: dict[t.Any, list[asyncio.Future]] = {}
+        self._handle: t.Optional[asyncio.Handle] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def load(self, *keys: t.Any) -> list[t.Any]:
+        loop = asyncio.get_running_loop()
+
+        futures = []
+        for key in keys:
+            future = loop.create_future()
+            self._pending.setdefault(key, []).append(future)
+            futures.append(future)
+
+        # keys requested within the delay, or the same loop iteration, are
+        # fetched together, full batch doesn't wait
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._handle is None:
+            if self.max_delay > 0:
+                self._handle = loop.call_later(self.max_delay, self._flush)
+            else:
+                self._handle = loop.call_soon(self._flush)
+
+        return await asyncio.gather(*futures)
+
+    async def close(self):
+        # pending keys are fetched rather than left waiting forever
+        if self._pending:
+            self._flush()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _flush(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+
+        for i in range(0, len(keys), self.batch_size):
+            task = asyncio.create_task(
+                self._fetch(keys[i:i+self.batch_size], pending)
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(
+            self,
+            keys: list[t.Any],
+            pending: dict[t.Any, list[asyncio.Future]]
+    ):
+        try:
+            results = await self.fetch(*keys)
+        except Exception as e:
+            for key in keys:
+                for future in pending[key]:
+                    if not future.done():
+                        future.set_exception(e)
+
+            return
+
+        for key, result in zip(keys, results):
+            for future in pending[key]:
+                if not future.done():
+                    future.set_result(result)
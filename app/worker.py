@@ -0,0 +1,63 @@
+#!/usr/local/bin/python
+
+import logging
+import asyncio
+import functools
+
+import uvloop
+
+import handlers
+import factory
+import constants as const
+import settings
+
+from storage import Cached
+
+log = logging.getLogger(const.LNK)
+
+
+async def work():
+    bus = factory.create_invalidation_bus()
+
+    # no local caching, only invalidation of web nodes caches on writes
+    storage = Cached(
+        factory.create_storage(),
+        size=0,
+        bus=bus
+    )
+    if not await storage.ping():
+        raise ConnectionError('cannot ping storage')
+
+    clipper_client = factory.create_clipper()
+    clip_jobs = factory.create_redis_clip_jobs()
+    run = functools.partial(
+        handlers.clipper_task, storage=storage, clipper=clipper_client
+    )
+
+    log.debug('worker initialized')
+
+    try:
+        await asyncio.gather(*(
+            clip_jobs.consume(run, f'{settings.CLIP_WORKER_ID}:{i}')
+            for i in range(settings.CLIP_WORKERS)
+        ))
+    finally:
+        await clip_jobs.close()
+        await clipper_client.close()
+        await storage.close()
+
+
+def main():
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format=settings.LOG_FORMAT,
+        datefmt=settings.LOG_DATEFMT
+    )
+
+    uvloop.install()
+
+    asyncio.run(work())
+
+
+if __name__ == '__main__':
+    main()